@@ -0,0 +1,110 @@
+import numpy as np
+
+from Board import *
+
+# cell kind
+EMPTY = 0
+OBSTACLE = 1
+MIRROR = 2
+START = 3
+END = 4
+
+DX = np.array([s[0] for s in STEP], dtype=np.int64)
+DY = np.array([s[1] for s in STEP], dtype=np.int64)
+# REFLECT_TABLE[rotation + 1, direction], rotation -1 or 1
+REFLECT_TABLE = np.array([REFLECT[-1], REFLECT[-1], REFLECT[1]], dtype=np.int64)
+
+
+def stack_boards(boards):
+    # (kinds, rotations, reflects), each shaped (len(boards), width, height)
+    grid_count = boards[0].grid_count
+    kinds = np.zeros((len(boards),) + grid_count, dtype=np.int8)
+    rotations = np.zeros((len(boards),) + grid_count, dtype=np.int8)
+    reflects = np.zeros((len(boards),) + grid_count, dtype=np.float64)
+
+    for i, board in enumerate(boards):
+        for o in board.obs_list:
+            kinds[(i,) + o.index] = OBSTACLE
+        for s in board.start_node_list:
+            kinds[(i,) + s.index] = START
+        for e in board.end_node_list:
+            kinds[(i,) + e.index] = END
+        for m in board.mirror_list:
+            kinds[(i,) + m.index] = MIRROR
+            rotations[(i,) + m.index] = m.rotation
+            reflects[(i,) + m.index] = m.reflect_percent
+    return kinds, rotations, reflects
+
+
+def evaluate(kinds, rotations, reflects, template, min_strength=EPSILON, max_steps=None):
+    # start and end nodes come from template and are shared by the whole batch,
+    # returns strengths shaped (batch, len(template.end_node_list)) in end_node_list order
+    batch, width, height = kinds.shape
+    end_count = len(template.end_node_list)
+    strengths = np.zeros((batch, end_count), dtype=np.float64)
+    if max_steps is None:
+        max_steps = 64 * (width + height)
+
+    color_list = sorted({s.color for s in template.start_node_list} | {e.color for e in template.end_node_list})
+    color_id = {color: i for i, color in enumerate(color_list)}
+
+    end_id = np.full((width, height), -1, dtype=np.int64)
+    end_direction = np.zeros(end_count, dtype=np.int64)
+    end_color = np.zeros(end_count, dtype=np.int64)
+    for i, e in enumerate(template.end_node_list):
+        end_id[e.index] = i
+        end_direction[i] = e.direction
+        end_color[i] = color_id[e.color]
+
+    # every live beam : board, cell, direction it is heading, color and strength
+    start_count = len(template.start_node_list)
+    b = np.repeat(np.arange(batch, dtype=np.int64), start_count)
+    x = np.tile(np.array([s.index[0] for s in template.start_node_list], dtype=np.int64), batch)
+    y = np.tile(np.array([s.index[1] for s in template.start_node_list], dtype=np.int64), batch)
+    d = np.tile(np.array([s.direction for s in template.start_node_list], dtype=np.int64), batch)
+    c = np.tile(np.array([color_id[s.color] for s in template.start_node_list], dtype=np.int64), batch)
+    s = np.tile(np.array([s.strength for s in template.start_node_list], dtype=np.float64), batch)
+
+    for _ in range(max_steps):
+        if b.size == 0:
+            break
+
+        x = x + DX[d]
+        y = y + DY[d]
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        b, x, y, d, c, s = b[inside], x[inside], y[inside], d[inside], c[inside], s[inside]
+
+        kind = kinds[b, x, y]
+
+        at_end = kind == END
+        if at_end.any():
+            eid = end_id[x[at_end], y[at_end]]
+            direction = d[at_end]
+            accept = ((end_direction[eid] == -1) | (np.abs(direction - end_direction[eid]) == 2)) & \
+                     (end_color[eid] == c[at_end])
+            np.add.at(strengths, (b[at_end][accept], eid[accept]), s[at_end][accept])
+
+        at_mirror = kind == MIRROR
+        percent = reflects[b[at_mirror], x[at_mirror], y[at_mirror]]
+        rotation = rotations[b[at_mirror], x[at_mirror], y[at_mirror]].astype(np.int64)
+        mb, mx, my, md, mc, ms = b[at_mirror], x[at_mirror], y[at_mirror], d[at_mirror], c[at_mirror], s[at_mirror]
+        through = percent < 100
+
+        passing = kind == EMPTY
+        b = np.concatenate((b[passing], mb, mb[through]))
+        x = np.concatenate((x[passing], mx, mx[through]))
+        y = np.concatenate((y[passing], my, my[through]))
+        d = np.concatenate((d[passing], REFLECT_TABLE[rotation + 1, md], md[through]))
+        c = np.concatenate((c[passing], mc, mc[through]))
+        s = np.concatenate((s[passing], ms * (percent / 100), (ms - ms * (percent / 100))[through]))
+
+        # beams sharing board, cell, direction and color move together from here on, so merge them
+        key = (((b * width + x) * height + y) * 4 + d) * len(color_list) + c
+        key, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+        s = np.bincount(inverse.ravel(), weights=s, minlength=key.size)
+        b, x, y, d, c = b[first], x[first], y[first], d[first], c[first]
+
+        alive = s > min_strength
+        b, x, y, d, c, s = b[alive], x[alive], y[alive], d[alive], c[alive], s[alive]
+
+    return strengths
@@ -0,0 +1,177 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+import pyglet
+
+BOARD_SIZES = (3, 5, 10, 20, 50, 100)
+MIRROR_DENSITIES = (0.05, 0.2)
+PARTIAL_DENSITIES = (0.0, 0.3)
+HOT_PATHS = ("trace", "update_line", "update_endnode", "update_mirror", "get_grid", "frame_idle", "frame_changed")
+
+
+def init_headless(headless=False):
+    # a hidden window is enough on desktops, headless needs pyglet's EGL backend but no display
+    if headless:
+        pyglet.options['headless'] = True
+    pyglet.options['shadow_window'] = False
+
+    import cocos
+    cocos.director.director.init(width=1000, height=1000, visible=False)
+
+
+def build_level(size, mirror_density, partial_density, seed):
+    from Board import RED, YELLOW, MOVABLE, STATIC, ROTATABLE
+    from Level import Level
+
+    rng = random.Random(seed)
+    level = Level((size, size))
+    colors = (RED, YELLOW)
+    rows = list(range(size))
+    rng.shuffle(rows)
+    for i in range(max(1, size // 4)):
+        level.start_list.append(((0, rows[i]), 1, colors[i % 2], 100))
+        level.end_list.append(((size - 1, rows[-1 - i]), colors[i % 2], 100, -1))
+
+    for x in range(1, size - 1):
+        for y in range(size):
+            if rng.random() < mirror_density:
+                reflect = rng.choice((50, 70, 90)) if rng.random() < partial_density else 100
+                level.mirror_list.append((rng.choice((MOVABLE, STATIC, ROTATABLE)), (x, y), rng.choice((-1, 1)), reflect))
+
+    return level
+
+
+def build_layer(level):
+    import cocos
+    from GameLayer import GameLayer
+
+    layer = GameLayer(cocos.layer.Layer(), cocos.layer.Layer(), [], 0)
+    layer.load_level(level)
+    return layer
+
+
+def time_calls(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start_time)
+    times.sort()
+    return {"mean": sum(times) / len(times), "p95": times[min(len(times) - 1, int(len(times) * 0.95))]}
+
+
+def bench_board(size, mirror_density, partial_density, repeat, seed=0):
+    from Board import trace
+    from GameObject import MovableMirror
+
+    layer = build_layer(build_level(size, mirror_density, partial_density, seed))
+    rng = random.Random(seed)
+    window = layer.screen_size
+    # changed frames trace on the main thread, so the timing covers the trace rather than handing it off
+    layer.trace_worker.async_time = float("inf")
+
+    layer.update(0)
+    lines_before = layer.line_pool.created
+    labels_before = layer.label_cache.created
+    relayouts_before = layer.label_cache.relayout_count
+
+    # a full trace every call, the trace cache would turn this into a lookup
+    timings = {"trace": time_calls(lambda: trace(layer.board), repeat),
+               "update_line": time_calls(lambda: layer.update_line(trace(layer.board)), repeat),
+               "update_endnode": time_calls(layer.update_endnode, repeat),
+               "update_mirror": time_calls(layer.update_mirror, repeat),
+               "get_grid": time_calls(lambda: layer.get_grid((rng.uniform(0, window[0]), rng.uniform(0, window[1]))),
+                                      repeat),
+               "frame_idle": time_calls(lambda: layer.update(0), repeat)}
+
+    movable = [m for m in layer.mirror_list if isinstance(m, MovableMirror)]
+
+    def changed_frame():
+        # a movable mirror onto a random empty cell, a layout the trace cache has not seen
+        layer.trace_cache.clear()
+        if movable:
+            m = rng.choice(movable)
+            target = rng.choice(layer.board.empty_cells_near(m.index, 8))
+            layer.cell_grid(m.index).move_item(layer.cell_grid(target))
+        else:
+            # nothing to move, every beam is traced again instead
+            layer.board.mark_dirty(*[s.index for s in layer.board.start_node_list])
+        layer.update(0)
+    timings["frame_changed"] = time_calls(changed_frame, repeat)
+
+    frames = repeat * len(timings)
+    return {"key": "size=%d mirrors=%.2f partial=%.2f" % (size, mirror_density, partial_density),
+            "size": size,
+            "mirror_density": mirror_density,
+            "partial_density": partial_density,
+            "segments": len(layer.trace_result.segments),
+            # runs settled by solve_cycle(), most of the trace time on boards where loops are common
+            "looped": trace(layer.board).looped,
+            "timings": timings,
+            "allocations_per_frame": {"lines": (layer.line_pool.created - lines_before) / frames,
+                                      "labels": (layer.label_cache.created - labels_before) / frames,
+                                      "label_relayouts": (layer.label_cache.relayout_count - relayouts_before) / frames},
+            "live": {"lines": len(layer.line_pool.line_list),
+                     "labels": len(layer.label_cache.owner_dict) + layer.label_cache.free_count}}
+
+
+def run_suite(sizes, repeat):
+    results = []
+    for size in sizes:
+        for mirror_density in MIRROR_DENSITIES:
+            for partial_density in PARTIAL_DENSITIES:
+                result = bench_board(size, mirror_density, partial_density, repeat)
+                results.append(result)
+                timings = result["timings"]
+                print("%-36s trace %8.3fms (%5d looped)  line %8.3fms  endnode %8.3fms  mirror %8.3fms  "
+                      "get_grid %8.4fms" % (result["key"], timings["trace"]["mean"] * 1000, result["looped"],
+                                            timings["update_line"]["mean"] * 1000,
+                                            timings["update_endnode"]["mean"] * 1000,
+                                            timings["update_mirror"]["mean"] * 1000,
+                                            timings["get_grid"]["mean"] * 1000))
+    return results
+
+
+def compare(results, baseline, threshold):
+    # hot paths whose mean got slower than threshold times the stored baseline
+    baseline_dict = {r["key"]: r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = baseline_dict.get(result["key"])
+        if old is None:
+            continue
+        for path in HOT_PATHS:
+            if path not in old["timings"]:
+                continue
+            before = old["timings"][path]["mean"]
+            after = result["timings"][path]["mean"]
+            if after > before * threshold:
+                regressions.append((result["key"], path, before, after))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time GameLayer hot paths on synthetic boards.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=BOARD_SIZES)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--out", default="bench_output.json")
+    parser.add_argument("--baseline", help="fail when a hot path is slower than in this result file")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--headless", action="store_true", help="use pyglet's headless backend")
+    args = parser.parse_args()
+
+    init_headless(args.headless)
+    results = run_suite(args.sizes, args.repeat)
+    with open(args.out, "w") as f:
+        json.dump({"python": sys.version, "pyglet": pyglet.version, "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for key, path, before, after in regressions:
+            print("REGRESSION %s %s : %.3fms -> %.3fms" % (key, path, before * 1000, after * 1000))
+        if regressions:
+            sys.exit(1)
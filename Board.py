@@ -0,0 +1,791 @@
+import heapq
+import math
+import random
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+
+# direction
+# -1(N) 0(↑) 1(→) 2(↓) 3(←)
+
+STEP = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+# mirror rotation \ = -1, / = 1
+REFLECT = {-1: (3, 2, 1, 0),
+           1: (1, 0, 3, 2)}
+
+# COLOR RGB
+RED = (227, 99, 135)
+PINK = (239, 187, 207)
+YELLOW = (255, 211, 105)
+
+# mirror kind
+MOVABLE = 0
+STATIC = 1
+ROTATABLE = 2
+
+# strengths closer than this are considered equal
+EPSILON = 1e-6
+# a run inside a loop is only solved exactly while taking it out adds at most this many edges, the rest is swept
+ELIMINATION_COST = 16
+# PathIndex only follows boards whose beams traced one by one walk at most this many times the runs of a merged trace
+MAX_OVERLAP = 2
+
+
+class MirrorRecord:
+    __slots__ = ("index", "kind", "rotation", "reflect_percent")
+
+    def __init__(self, index, kind, rotation, reflect_percent):
+        self.index = tuple(index)
+        self.kind = kind
+        self.rotation = rotation
+        self.reflect_percent = reflect_percent
+
+    def reflect(self, from_dir):
+        return REFLECT[self.rotation][from_dir]
+
+    def copy(self):
+        return MirrorRecord(self.index, self.kind, self.rotation, self.reflect_percent)
+
+
+class StartRecord:
+    __slots__ = ("index", "direction", "color", "strength")
+
+    def __init__(self, index, direction, color, strength):
+        self.index = tuple(index)
+        self.direction = direction
+        self.color = tuple(color)
+        self.strength = strength
+
+    def copy(self):
+        return StartRecord(self.index, self.direction, self.color, self.strength)
+
+
+class EndRecord:
+    __slots__ = ("index", "color", "goal_strength", "direction")
+
+    def __init__(self, index, color, goal_strength, direction=-1):
+        self.index = tuple(index)
+        self.color = tuple(color)
+        self.goal_strength = goal_strength
+        self.direction = direction
+
+    def copy(self):
+        return EndRecord(self.index, self.color, self.goal_strength, self.direction)
+
+    def accepts(self, direction, color):
+        if self.direction != -1 and abs(direction - self.direction) != 2:
+            return False
+        return self.color == color
+
+
+class ObstacleRecord:
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = tuple(index)
+
+    def copy(self):
+        return ObstacleRecord(self.index)
+
+
+_zobrist_dict = {}
+
+
+def zobrist_key(record):
+    # random 64 bit key for a record on its cell, covering only what trace() looks at,
+    # seeded from the content so every process hands out the same keys
+    if isinstance(record, MirrorRecord):
+        feature = (record.index, 0, record.rotation, record.reflect_percent)
+    elif isinstance(record, StartRecord):
+        feature = (record.index, 1, record.direction, record.color, record.strength)
+    elif isinstance(record, EndRecord):
+        feature = (record.index, 2, record.color, record.direction)
+    else:
+        feature = (record.index, 3)
+
+    key = _zobrist_dict.get(feature)
+    if key is None:
+        key = _zobrist_dict[feature] = random.Random(hash(feature)).getrandbits(64)
+    return key
+
+
+class Board:
+    def __init__(self, grid_count):
+        self.grid_count = tuple(grid_count)
+        # only occupied cells are stored, so a board costs memory by its items rather than its area
+        self.cell_dict = {}
+        # x -> sorted y of the occupied cells in that column, y -> sorted x of the occupied cells in that row
+        self.column_dict = {}
+        self.row_dict = {}
+
+        self.mirror_list = []
+        self.start_node_list = []
+        self.end_node_list = []
+        self.obs_list = []
+
+        # bumped on every change, renderers compare it against the version they last traced
+        self.version = 0
+        # xor of zobrist_key() over every record, equal layouts hash equal however they were reached
+        self.hash = 0
+        # cells changed since a PathIndex last caught up, None until one follows this board
+        self.changed_cells = None
+
+    def mark_dirty(self, *index_list):
+        self.version += 1
+        if self.changed_cells is not None:
+            self.changed_cells.update(index_list)
+
+    def snapshot(self):
+        # an independent copy with the same version and hash, safe to trace on another thread
+        board = Board(self.grid_count)
+        for l in (self.start_node_list, self.end_node_list, self.obs_list, self.mirror_list):
+            for record in l:
+                board.place(record.copy())
+        board.version = self.version
+        return board
+
+    def in_bounds(self, index):
+        return 0 <= index[0] < self.grid_count[0] and 0 <= index[1] < self.grid_count[1]
+
+    def get(self, index):
+        return self.cell_dict.get(index)
+
+    def empty_count(self):
+        return self.grid_count[0] * self.grid_count[1] - len(self.cell_dict)
+
+    def occupy(self, index, record):
+        self.cell_dict[index] = record
+        insort(self.column_dict.setdefault(index[0], []), index[1])
+        insort(self.row_dict.setdefault(index[1], []), index[0])
+
+    def vacate(self, index):
+        del self.cell_dict[index]
+        for line_dict, key, value in ((self.column_dict, index[0], index[1]), (self.row_dict, index[1], index[0])):
+            line = line_dict[key]
+            del line[bisect_left(line, value)]
+            if not line:
+                del line_dict[key]
+
+    def next_item(self, index, direction):
+        # the first occupied cell past index in direction and its record,
+        # or the first cell past the border and None when nothing is in the way
+        x, y = index
+        if direction == 0 or direction == 2:
+            line = self.column_dict.get(x, ())
+            if direction == 0:
+                i = bisect_right(line, y)
+                next_index = (x, line[i]) if i < len(line) else (x, self.grid_count[1])
+            else:
+                i = bisect_left(line, y) - 1
+                next_index = (x, line[i]) if i >= 0 else (x, -1)
+        else:
+            line = self.row_dict.get(y, ())
+            if direction == 1:
+                i = bisect_right(line, x)
+                next_index = (line[i], y) if i < len(line) else (self.grid_count[0], y)
+            else:
+                i = bisect_left(line, x) - 1
+                next_index = (line[i], y) if i >= 0 else (-1, y)
+        return next_index, self.cell_dict.get(next_index)
+
+    def empty_cells_near(self, index, count):
+        # up to count empty cells, nearest to index first by steps along the grid
+        cells = []
+        for distance in range(self.grid_count[0] + self.grid_count[1]):
+            for dx in range(-distance, distance + 1):
+                rest = distance - abs(dx)
+                for dy in ((-rest, rest) if rest else (0,)):
+                    cell = (index[0] + dx, index[1] + dy)
+                    if self.in_bounds(cell) and cell not in self.cell_dict:
+                        cells.append(cell)
+                        if len(cells) == count:
+                            return cells
+        return cells
+
+    def place(self, record):
+        self.occupy(record.index, record)
+        self.hash ^= zobrist_key(record)
+
+        if isinstance(record, MirrorRecord):
+            self.mirror_list.append(record)
+        elif isinstance(record, StartRecord):
+            self.start_node_list.append(record)
+        elif isinstance(record, EndRecord):
+            self.end_node_list.append(record)
+        elif isinstance(record, ObstacleRecord):
+            self.obs_list.append(record)
+        self.mark_dirty(record.index)
+        return record
+
+    def remove(self, index):
+        record = self.get(index)
+        self.vacate(record.index)
+        self.hash ^= zobrist_key(record)
+
+        for l in (self.mirror_list, self.start_node_list, self.end_node_list, self.obs_list):
+            if record in l:
+                l.remove(record)
+        self.mark_dirty(record.index)
+        return record
+
+    def move_item(self, from_index, to_index):
+        record = self.get(tuple(from_index))
+        self.vacate(record.index)
+        self.hash ^= zobrist_key(record)
+        record.index = tuple(to_index)
+        self.occupy(record.index, record)
+        self.hash ^= zobrist_key(record)
+        self.mark_dirty(tuple(from_index), record.index)
+
+    def rotate_mirror(self, index):
+        self.set_rotation(index, -self.get(index).rotation)
+
+    def set_rotation(self, index, rotation):
+        record = self.get(index)
+        if record.rotation == rotation:
+            return
+        self.hash ^= zobrist_key(record)
+        record.rotation = rotation
+        self.hash ^= zobrist_key(record)
+        self.mark_dirty(record.index)
+
+
+class GridMapper:
+    def __init__(self, grid_count, border_gap, grid_size, gap_size):
+        self.grid_count = tuple(grid_count)
+        self.border_gap = border_gap
+        self.grid_size = grid_size
+        self.stride = grid_size + gap_size
+        self.first = border_gap + grid_size / 2
+
+    def position(self, index):
+        return self.first + index[0] * self.stride, self.first + index[1] * self.stride
+
+    def axis_index(self, value, count):
+        offset = value - self.border_gap
+        i = math.floor(offset / self.stride)
+        if not 0 <= i < count or offset - i * self.stride > self.grid_size:
+            return None
+        return i
+
+    def world_size(self):
+        return tuple(self.border_gap * 2 + count * self.stride - (self.stride - self.grid_size)
+                     for count in self.grid_count)
+
+    def index_range(self, rect):
+        # cells overlapping the world rect (left, bottom, right, top) as (x0, y0, x1, y1), upper bounds excluded
+        low = [max(0, math.floor((rect[i] - self.border_gap) / self.stride)) for i in (0, 1)]
+        high = [min(self.grid_count[i], math.floor((rect[i + 2] - self.border_gap) / self.stride) + 1) for i in (0, 1)]
+        return low[0], low[1], max(low[0], high[0]), max(low[1], high[1])
+
+    def index_at(self, position):
+        x = self.axis_index(position[0], self.grid_count[0])
+        if x is None:
+            return None
+        y = self.axis_index(position[1], self.grid_count[1])
+        if y is None:
+            return None
+        return x, y
+
+
+class TraceResult:
+    __slots__ = ("segments", "strengths", "calls", "depth", "looped")
+
+    def __init__(self, segments, strengths):
+        # segment : (from_index, to_index, color, strength), one straight run that may end outside the board
+        self.segments = segments
+        self.strengths = strengths
+        # how many runs were walked and how deep the beam splitting went
+        self.calls = 0
+        self.depth = 0
+        # runs inside loops, the ones solve_cycle() had to settle
+        self.looped = 0
+
+
+def is_cleared(board, strengths):
+    for e in board.end_node_list:
+        if abs(strengths[e.index] - e.goal_strength) > EPSILON:
+            return False
+    return True
+
+
+class EndTracker:
+    # end node totals as of the last trace, only the ones that moved past EPSILON are reported
+    def __init__(self):
+        self.strengths = {}
+        # end nodes at their goal strength
+        self.met = set()
+        self.cleared = False
+
+    def update(self, board, strengths):
+        # [(end node index, new strength)] for the totals that changed, also settles cleared
+        changes = []
+        for e in board.end_node_list:
+            strength = strengths[e.index]
+            old = self.strengths.get(e.index)
+            if old is not None and abs(strength - old) <= EPSILON:
+                continue
+            self.strengths[e.index] = strength
+            if abs(strength - e.goal_strength) <= EPSILON:
+                self.met.add(e.index)
+            else:
+                self.met.discard(e.index)
+            changes.append((e.index, strength))
+        self.cleared = len(self.met) == len(board.end_node_list)
+        return changes
+
+
+def trace(board):
+    # every straight run is a state (origin cell, direction, color), beams sharing a state are merged
+    # into one flow so the work grows with the board instead of with the number of split paths
+    flow = _FlowGraph(board)
+    for s in board.start_node_list:
+        flow.add_source(s.index, s.direction, s.color, s.strength)
+    flow.expand()
+    return flow.solve()
+
+
+class TraceCache:
+    # recent trace results by board hash, going back to a layout costs one lookup instead of a trace
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.result_dict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, board):
+        return board.grid_count, board.hash
+
+    def get(self, board):
+        key = self.key(board)
+        result = self.result_dict.get(key)
+        if result is not None:
+            self.result_dict.move_to_end(key)
+        return result
+
+    def put(self, board, result):
+        self.store(self.key(board), result)
+
+    def store(self, key, result):
+        self.result_dict[key] = result
+        self.result_dict.move_to_end(key)
+        if len(self.result_dict) > self.capacity:
+            self.result_dict.popitem(last=False)
+
+    def trace(self, board):
+        result = self.get(board)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = trace(board)
+        self.put(board, result)
+        return result
+
+    def clear(self):
+        self.result_dict.clear()
+
+
+class PathIndex:
+    # traces every start node on its own and remembers which cells its beam crosses, beams add up linearly
+    # so after a change only the beams crossing the changed cells are traced again and summed back in
+    def __init__(self):
+        self.board = None
+        # start record -> (its own TraceResult, cells its runs cross or stop at)
+        self.path_dict = {}
+        # cell -> start records whose beam crosses it
+        self.cell_dict = {}
+        # (from_index, to_index, color) -> {start record : strength}, in the order the runs first appeared
+        self.segment_dict = {}
+        # end node index -> {start record : strength}
+        self.hit_dict = {}
+        self.segments = {}
+        self.strengths = {}
+
+        # runs one update may trace, None when the board is left to merged traces
+        self.budget = None
+
+        # beams traced again and beams kept over the index's lifetime
+        self.retraced = 0
+        self.kept = 0
+
+    def reset(self, board):
+        # a new board gets one merged trace, which also decides whether the beams are worth indexing one by one,
+        # the index itself is built by the first update
+        self.board = board
+        self.clear()
+        flow = _FlowGraph(board)
+        for s in board.start_node_list:
+            flow.add_source(s.index, s.direction, s.color, s.strength)
+        flow.expand()
+        merged = flow.solve()
+
+        # beams in loops or sharing many runs cost more traced one by one than merged, those boards are left
+        # to merged traces, as is any board an update later pushes past the budget
+        if flow.forward and flow.beam_runs() <= merged.calls * MAX_OVERLAP:
+            self.budget = merged.calls * MAX_OVERLAP
+            board.changed_cells = set()
+        else:
+            self.budget = None
+            board.changed_cells = None
+        return merged
+
+    def clear(self):
+        self.path_dict.clear()
+        self.cell_dict.clear()
+        self.segment_dict.clear()
+        self.hit_dict.clear()
+        self.segments.clear()
+        self.strengths.clear()
+
+    def abandon(self):
+        self.budget = None
+        self.board.changed_cells = None
+        self.clear()
+
+    def trace(self, board):
+        if board is not self.board:
+            return self.reset(board)
+        if self.budget is None:
+            return trace(board)
+
+        affected = set()
+        for index in board.changed_cells:
+            affected.update(self.cell_dict.get(index, ()))
+        board.changed_cells.clear()
+
+        live = set(board.start_node_list)
+        affected.update(s for s in live if s not in self.path_dict)
+        self.kept += len(self.path_dict) - len(affected & self.path_dict.keys())
+
+        calls = 0
+        touched_segments = set()
+        touched_ends = set()
+        for s in affected:
+            if s in self.path_dict:
+                self.drop(s, touched_segments, touched_ends)
+            if s in live:
+                result = self.trace_start(s)
+                calls += result.calls
+                if calls > self.budget or result.looped:
+                    self.abandon()
+                    return trace(board)
+                touched_segments.update(segment[:3] for segment in result.segments)
+                touched_ends.update(index for index, strength in result.strengths.items() if strength)
+
+        for key in touched_segments:
+            contributions = self.segment_dict.get(key)
+            if contributions:
+                self.segments[key] = sum(contributions.values())
+            else:
+                self.segments.pop(key, None)
+                self.segment_dict.pop(key, None)
+
+        strengths = {}
+        for e in board.end_node_list:
+            if e.index in touched_ends or e.index not in self.strengths:
+                strengths[e.index] = sum(self.hit_dict.get(e.index, {}).values())
+            else:
+                strengths[e.index] = self.strengths[e.index]
+        self.strengths = strengths
+
+        result = TraceResult([key + (strength,) for key, strength in self.segments.items()], dict(strengths))
+        result.calls = calls
+        result.depth = max((r.depth for r, _ in self.path_dict.values()), default=0)
+        return result
+
+    def trace_start(self, s):
+        self.retraced += 1
+        flow = _FlowGraph(self.board)
+        flow.add_source(s.index, s.direction, s.color, s.strength)
+        flow.expand()
+        result = flow.solve()
+
+        cells = {s.index}
+        for from_index, to_index, color, strength in result.segments:
+            self.segment_dict.setdefault((from_index, to_index, color), {})[s] = strength
+            step = (_sign(to_index[0] - from_index[0]), _sign(to_index[1] - from_index[1]))
+            index = from_index
+            while index != to_index:
+                index = (index[0] + step[0], index[1] + step[1])
+                cells.add(index)
+        for index, strength in result.strengths.items():
+            if strength:
+                self.hit_dict.setdefault(index, {})[s] = strength
+
+        for index in cells:
+            self.cell_dict.setdefault(index, set()).add(s)
+        self.path_dict[s] = (result, cells)
+        return result
+
+    def drop(self, s, touched_segments, touched_ends):
+        # takes the beam's share out, noting the runs and end nodes it fed
+        result, cells = self.path_dict.pop(s)
+        for index in cells:
+            self.cell_dict[index].discard(s)
+            if not self.cell_dict[index]:
+                del self.cell_dict[index]
+        for segment in result.segments:
+            key = segment[:3]
+            self.segment_dict[key].pop(s, None)
+            touched_segments.add(key)
+        for index in result.strengths:
+            hits = self.hit_dict.get(index)
+            if hits is not None and hits.pop(s, None) is not None:
+                touched_ends.add(index)
+
+
+def _sign(value):
+    return (value > 0) - (value < 0)
+
+
+class _FlowGraph:
+    def __init__(self, board):
+        self.board = board
+        self.state_dict = {}
+        self.states = []       # (origin_index, direction, color)
+        self.targets = []      # the cell each run stops at, may lie outside the board
+        self.edges = []        # [(state, fraction of the strength it receives)]
+        self.sources = {}      # state -> strength emitted straight into it by start nodes
+        self.end_hits = {}     # state -> end node index the run feeds
+        # True while no run feeds one discovered before it, discovery order is then topological and
+        # expand() settles strength and depth as it goes
+        self.forward = True
+        self.strength = []
+        self.depth = []
+
+    def state(self, origin_index, direction, color):
+        key = (origin_index, direction, color)
+        v = self.state_dict.get(key)
+        if v is None:
+            v = self.state_dict[key] = len(self.states)
+            self.states.append(key)
+            self.strength.append(0)
+            self.depth.append(1)
+        return v
+
+    def add_source(self, origin_index, direction, color, strength):
+        v = self.state(origin_index, direction, color)
+        self.sources[v] = self.sources.get(v, 0) + strength
+        self.strength[v] += strength
+
+    def expand(self):
+        # visits every reachable run once, each run jumps straight to the cell it stops at,
+        # targets and edges are filled in the same order as the states
+        board = self.board
+        state_dict = self.state_dict
+        states = self.states
+        strength = self.strength
+        depth = self.depth
+        forward = self.forward
+        v = 0
+        while v < len(states):
+            origin_index, direction, color = states[v]
+            next_index, item = board.next_item(origin_index, direction)
+            self.targets.append(next_index)
+            edges = []
+            self.edges.append(edges)
+
+            if isinstance(item, MirrorRecord):
+                percent = item.reflect_percent / 100
+                reflected = ((next_index, item.reflect(direction), color), percent)
+                if item.reflect_percent < 100:
+                    outgoing = (reflected, ((next_index, direction, color), 1 - percent))
+                else:
+                    outgoing = (reflected,)
+                for key, fraction in outgoing:
+                    # state() inlined, most runs are new and this is the hot loop of the solver
+                    w = state_dict.get(key)
+                    if w is None:
+                        w = state_dict[key] = len(states)
+                        states.append(key)
+                        strength.append(0)
+                        depth.append(1)
+                    edges.append((w, fraction))
+
+                    # every run feeding v came before it and is done, so v's strength is final
+                    if w <= v:
+                        forward = False
+                    elif forward:
+                        strength[w] += strength[v] * fraction
+                        if depth[w] <= depth[v]:
+                            depth[w] = depth[v] + 1
+            elif isinstance(item, EndRecord) and item.accepts(direction, color):
+                self.end_hits[v] = next_index
+            v += 1
+        self.forward = forward
+
+    def beam_runs(self):
+        # runs counted once for every start node whose beam reaches them, what tracing each start on its own
+        # would walk, only meaningful while forward holds and every run comes after the runs feeding it
+        reach = [0] * len(self.states)
+        for i, v in enumerate(self.sources):
+            reach[v] |= 1 << i
+        total = 0
+        for v, edges in enumerate(self.edges):
+            total += reach[v].bit_count()
+            for w, _ in edges:
+                reach[w] |= reach[v]
+        return total
+
+    def components(self):
+        # Tarjan's strongly connected components without recursion, returned sources first
+        count = len(self.states)
+        order = [-1] * count
+        low = [0] * count
+        on_stack = [False] * count
+        stack = []
+        component_list = []
+        counter = 0
+
+        for root in range(count):
+            if order[root] != -1:
+                continue
+            work = [(root, 0)]
+            while work:
+                v, i = work.pop()
+                if i == 0:
+                    order[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = True
+                else:
+                    # back from the child reached through edge i - 1
+                    low[v] = min(low[v], low[self.edges[v][i - 1][0]])
+
+                edges = self.edges[v]
+                while i < len(edges):
+                    w = edges[i][0]
+                    i += 1
+                    if order[w] == -1:
+                        work.append((v, i))
+                        work.append((w, 0))
+                        break
+                    if on_stack[w]:
+                        low[v] = min(low[v], order[w])
+                else:
+                    if low[v] == order[v]:
+                        component = []
+                        while True:
+                            w = stack.pop()
+                            on_stack[w] = False
+                            component.append(w)
+                            if w == v:
+                                break
+                        component_list.append(component)
+        component_list.reverse()
+        return component_list
+
+    def solve(self):
+        count = len(self.states)
+        result = TraceResult([], {e.index: 0 for e in self.board.end_node_list})
+        result.calls = count
+        if self.forward:
+            # no loops to find, expand() already settled every run
+            result.depth = max(self.depth, default=0)
+            return self.collect(result, self.strength)
+
+        inflow = [0] * count
+        for v, value in self.sources.items():
+            inflow[v] += value
+        strength = [0] * count
+        depth = [1] * count
+        component_of = [0] * count
+
+        component_list = self.components()
+        for c, component in enumerate(component_list):
+            for v in component:
+                component_of[v] = c
+
+        for c, component in enumerate(component_list):
+            if len(component) == 1 and all(w != component[0] for w, _ in self.edges[component[0]]):
+                strength[component[0]] = inflow[component[0]]
+            else:
+                self.solve_cycle(component, component_of, c, inflow, strength)
+                result.looped += len(component)
+
+            for v in component:
+                for w, fraction in self.edges[v]:
+                    if component_of[w] != c:
+                        inflow[w] += strength[v] * fraction
+                        depth[w] = max(depth[w], depth[v] + 1)
+                result.depth = max(result.depth, depth[v])
+        return self.collect(result, strength)
+
+    def collect(self, result, strength):
+        for (origin_index, direction, color), target, value in zip(self.states, self.targets, strength):
+            result.segments.append((origin_index, target, color, value))
+        for v, index in self.end_hits.items():
+            result.strengths[index] += strength[v]
+        return result
+
+    def solve_cycle(self, component, component_of, c, inflow, strength):
+        # the loop group is a linear system, strength[v] = inflow[v] + sum of fraction * strength[u] over the
+        # runs u feeding v. Runs are taken out exactly one at a time, cheapest first: a run taken out hands its
+        # inflow and its inputs straight on to the runs it feeds. Once every run left would add more than
+        # ELIMINATION_COST edges the rest is swept until it settles, the taken out runs are filled in backwards.
+        succ = {v: {} for v in component}
+        pred = {v: {} for v in component}
+        for v in component:
+            for w, fraction in self.edges[v]:
+                if fraction and component_of[w] == c:
+                    succ[v][w] = succ[v].get(w, 0) + fraction
+                    pred[w][v] = succ[v][w]
+        base = {v: inflow[v] for v in component}
+
+        cost = {v: len(pred[v]) * len(succ[v]) for v in component}
+        heap = [(cost[v], v) for v in component]
+        heapq.heapify(heap)
+        eliminated = []
+        while heap:
+            k_cost, k = heapq.heappop(heap)
+            if cost.get(k) != k_cost:
+                continue
+            if k_cost > ELIMINATION_COST:
+                break
+            del cost[k]
+
+            inputs = pred.pop(k)
+            outputs = succ.pop(k)
+            # a beam coming back to k keeps `loop` of itself every lap, k passes on the sum over all laps,
+            # which stays finite as a loop fed from a start node always leaks
+            loop = outputs.pop(k, 0)
+            inputs.pop(k, None)
+            scale = 1 / max(1 - loop, EPSILON)
+            for u in inputs:
+                del succ[u][k]
+            for w in outputs:
+                del pred[w][k]
+
+            for w, fraction in outputs.items():
+                fraction *= scale
+                base[w] += base[k] * fraction
+                for u, u_fraction in inputs.items():
+                    value = succ[u].get(w, 0) + u_fraction * fraction
+                    succ[u][w] = value
+                    pred[w][u] = value
+            eliminated.append((k, scale * base[k], [(u, scale * f) for u, f in inputs.items()]))
+
+            for v in inputs.keys() | outputs.keys():
+                cost[v] = len(pred[v]) * len(succ[v])
+                heapq.heappush(heap, (cost[v], v))
+
+        # what is left only keeps part of the beam on every lap, so sweeping it converges to the steady strength,
+        # in the order the beams first reached the runs which settles in far fewer laps
+        rows = [(v, base[v], list(pred[v].items())) for v in sorted(cost)]
+        for _ in range(10000):
+            change = 0
+            for v, value, predecessors in rows:
+                for u, fraction in predecessors:
+                    value += strength[u] * fraction
+                if abs(value - strength[v]) > change:
+                    change = abs(value - strength[v])
+                strength[v] = value
+            if change <= EPSILON * EPSILON:
+                break
+
+        # every input of k was taken out after k or swept, so it is settled by the time k is reached
+        for k, value, inputs in reversed(eliminated):
+            for u, fraction in inputs:
+                value += strength[u] * fraction
+            strength[k] = value
@@ -1,13 +1,27 @@
+import time
+
 import cocos
 from cocos.euclid import *
+from pyglet.window import key, mouse
 
+from Board import *
 from GameObject import *
+from Heatmap import Heatmap
+from Pool import *
+from TraceWorker import DropSpeculator, TraceWorker
+from Viewport import *
 from cocos.director import director
 
-# COLOR RGB
-RED = (227, 99, 135)
-PINK = (239, 187, 207)
-YELLOW = (255, 211, 105)
+MIRROR_KIND = {MovableMirror: MOVABLE,
+               StaticMirror: STATIC,
+               RotatableMirror: ROTATABLE}
+MIRROR_CLASS = {kind: c for c, kind in MIRROR_KIND.items()}
+
+# cells never get smaller than this, larger boards scroll instead
+MIN_GRID_SIZE = 80
+PAN_KEYS = {key.LEFT: (1, 0), key.RIGHT: (-1, 0), key.UP: (0, -1), key.DOWN: (0, 1)}
+# nearest drop cells traced ahead while dragging, as a share of the trace cache
+SPECULATE_SHARE = 0.5
 
 
 def center_position(v1, v2):
@@ -26,18 +40,38 @@ class GameLayer(cocos.layer.Layer):
         self.stages = stages
         self.index = index
 
-        self.matrix = []
+        # Grid for each occupied cell only, empty cells get a throwaway one when asked for
+        self.grid_dict = {}
+        self.board = None
+        self.mapper = None
+        self.trace_result = None
+        self.traced_version = -1
+        self.trace_cache = TraceCache()
+        self.end_tracker = None
+        self.path_index = PathIndex()
+        self.trace_worker = TraceWorker()
+        self.speculator = DropSpeculator()
+        self.heatmap = None
+        self.show_heatmap = False
         self.mirror_list = []
         self.start_node_list = []
         self.end_node_list = []
-        self.line_list = []
+        self.line_pool = None
+        self.label_cache = LabelCache(self)
         self.obs_list = []
+        self.viewport = None
+        self.chunk_grid = None
+        # cells on screen as (x0, y0, x1, y1)
+        self.view_range = None
 
         self.grid_count = (5, 5)
         self.gap_percent = (25, 1)
         self.border_gap = 10
 
         self.checking_grid = None
+        self.profiler = None
+        # the scene escape goes back to, set by the menu
+        self.menu_scene = None
 
         self.gap_size = 0
         self.grid_size = 0
@@ -48,132 +82,192 @@ class GameLayer(cocos.layer.Layer):
     # direction
     # -1(N) 0(↑) 1(→) 2(↓) 3(←)
 
-    def update_line(self):
-        for l in self.line_list:
-            self.line_layer.remove(l)
-        self.line_list.clear()
-        for e in self.end_node_list:
-            e.color = (255, 255, 255)
-
-        for s in self.start_node_list:
-            self.search_next(s.index, s.direction, s.color, s.strength)
-
-    def search_next(self, origin_index, direction, color, strength):
-        next_index = (-1, -1)
-        if direction == 0:
-            next_index = (origin_index[0], origin_index[1] + 1)
-        elif direction == 1:
-            next_index = (origin_index[0] + 1, origin_index[1])
-        elif direction == 2:
-            next_index = (origin_index[0], origin_index[1] - 1)
-        elif direction == 3:
-            next_index = (origin_index[0] - 1, origin_index[1])
-
-        if 0 <= next_index[0] < self.grid_count[0] and 0 <= next_index[1] < self.grid_count[1]:
-            next_grid = self.matrix[next_index[0]][next_index[1]]
-            line = self.spawn_line(origin_index, next_index, color, strength)
-
-            if next_grid.item_ins is not None:
-                if isinstance(next_grid.item_ins, Mirror):
-                    origin_strength = strength
-                    strength = strength * (next_grid.item_ins.reflect_percent / 100)
-                    self.search_next(next_index, next_grid.item_ins.reflect(direction), color, strength)
-                    if next_grid.item_ins.reflect_percent < 100:
-                        self.search_next(next_index, direction, color, origin_strength - strength)
-                elif isinstance(next_grid.item_ins, EndNode):
-                    if next_grid.item_ins.direction == -1 or abs(direction - next_grid.item_ins.direction) == 2:
-                        if tuple(next_grid.item_ins.activated_color) == tuple(color):
-                            next_grid.item_ins.add_strength(strength)
-                    return
-            else:
-                self.search_next(next_index, direction, color, strength)
-        else:
-            origin_pos = self.matrix[origin_index[0]][origin_index[1]].position
-            next_pos = (-1, -1)
-            adder = self.grid_size + self.gap_size
-            if direction == 0:
-                next_pos = (origin_pos[0], origin_pos[1] + adder)
-            elif direction == 1:
-                next_pos = (origin_pos[0] + adder, origin_pos[1])
-            elif direction == 2:
-                next_pos = (origin_pos[0], origin_pos[1] - adder)
-            elif direction == 3:
-                next_pos = (origin_pos[0] - adder, origin_pos[1])
-
-            self.spawn_line_pos(origin_pos, next_pos, color, strength)
-            return
+    def update_line(self, result=None):
+        self.trace_result = result if result is not None else self.trace_cache.trace(self.board)
+        self.line_pool.render(self.visible_segments())
+
+    def request_trace(self):
+        # cached and quick boards are traced right away, the rest go to the worker thread,
+        # right away only the beams crossing the cells changed since the last trace here are traced again
+        result = self.trace_cache.get(self.board)
+        if result is not None:
+            self.trace_cache.hits += 1
+            return result
+        if not self.trace_worker.slow:
+            start_time = time.perf_counter()
+            self.trace_cache.misses += 1
+            result = self.path_index.trace(self.board)
+            self.trace_cache.put(self.board, result)
+            self.trace_worker.trace_time = time.perf_counter() - start_time
+            return result
+
+        self.trace_worker.submit(self.board.snapshot())
+        return None
+
+    def collect_trace(self):
+        done = self.trace_worker.poll()
+        if done is None:
+            return None
+        board, result = done
+        self.trace_cache.put(board, result)
+        if board.version != self.board.version or self.trace_cache.key(board) != self.trace_cache.key(self.board):
+            # the board changed while this was traced, or the stage did, the newer state was requested already
+            self.trace_worker.dropped += 1
+            return None
+        return result
+
+    def visible_segments(self):
+        if self.view_range is None:
+            return self.trace_result.segments
+        # lines reach half a cell past their ends, so runs just outside the view still count
+        x0, y0, x1, y1 = self.view_range
+        return [s for s in self.trace_result.segments
+                if min(s[0][0], s[1][0]) <= x1 and max(s[0][0], s[1][0]) >= x0 - 1 and
+                min(s[0][1], s[1][1]) <= y1 and max(s[0][1], s[1][1]) >= y0 - 1]
+
+    def in_view(self, index):
+        if self.view_range is None:
+            return True
+        x0, y0, x1, y1 = self.view_range
+        return x0 <= index[0] < x1 and y0 <= index[1] < y1
+
+    def update_view(self):
+        self.viewport.changed = False
+        self.view_range = self.mapper.index_range(self.viewport.visible_rect())
+        self.chunk_grid.show(self.view_range)
+
+        for item in self.mirror_list + self.start_node_list + self.end_node_list:
+            visible = self.in_view(item.index)
+            if visible != item.visible:
+                item.visible = visible
+                if visible:
+                    item.draw_indi()
+                else:
+                    self.label_cache.release(item)
+
+        if self.trace_result is not None:
+            self.line_pool.render(self.visible_segments())
+
+    def index_position(self, index):
+        return self.mapper.position(index)
 
     def init_grid(self):
         grid_count_max = max(self.grid_count[0], self.grid_count[1])
         self.gap_size = (self.screen_size[0] - self.border_gap * 2) / (
                 grid_count_max * self.gap_percent[0] + (grid_count_max - 1) * self.gap_percent[1])
+        self.gap_size = max(self.gap_size, MIN_GRID_SIZE / self.gap_percent[0])
         self.grid_size = self.gap_size * self.gap_percent[0]
         self.grid_scale = self.grid_size / 2000
 
-        first = self.border_gap + self.grid_size / 2
-
-        for x in range(self.grid_count[0]):
-            t_list = []
-            for y in range(self.grid_count[1]):
-                x_pos = first + x * (self.grid_size + self.gap_size)
-                y_pos = first + y * (self.grid_size + self.gap_size)
-
-                grid = Grid((x_pos, y_pos), (x, y), self, self.grid_layer)
-                t_list.append(grid)
-            self.matrix.append(t_list)
-
-    def spawn_line(self, from_index, to_index, color, strength):
-        from_pos = self.matrix[from_index[0]][from_index[1]].position
-        to_pos = self.matrix[to_index[0]][to_index[1]].position
+        self.mapper = GridMapper(self.grid_count, self.border_gap, self.grid_size, self.gap_size)
 
-        l = Line(from_pos, to_pos, color, strength, self, from_index, to_index)
-        self.line_list.append(l)
-        self.line_layer.add(l)
+        self.viewport = Viewport((self.grid_layer, self.line_layer, self), self.screen_size, self.mapper.world_size())
+        # pools outlive the stage, the next one picks up their sprites
+        if self.chunk_grid is None:
+            self.chunk_grid = ChunkGrid(self)
+            self.heatmap = Heatmap(self)
+            self.line_pool = LinePool(self, self.line_layer)
+        self.line_pool.set_scale(self.grid_scale)
 
-        return l
+        self.board = Board(self.grid_count)
+        self.end_tracker = EndTracker()
 
-    def spawn_line_pos(self, from_pos, to_pos, color, strength):
-        l = Line(from_pos, to_pos, color, strength, self)
-        self.line_list.append(l)
-        self.line_layer.add(l)
-
-        return l
+    def load_stage(self, index):
+        self.index = index
+        self.load_level(self.stages[index])
+
+    def load_level(self, level):
+        if self.board is not None:
+            self.unload_level()
+        self.grid_count = level.grid_count
+        self.init_grid()
+
+        # items spawned off screen start culled, so they never build a label
+        if level.start_list:
+            self.viewport.look_at(self.mapper.position(level.start_list[0][0]))
+        self.view_range = self.mapper.index_range(self.viewport.visible_rect())
+
+        for index, direction, color, strength in level.start_list:
+            self.spawn_start_node(index, direction, color, strength)
+        for index, color, goal_strength, direction in level.end_list:
+            self.spawn_end_node(index, color, goal_strength, direction)
+        for index in level.obs_list:
+            self.spawn_obs(index)
+        for kind, index, rotation, reflect in level.mirror_list:
+            self.spawn_mirror(MIRROR_CLASS[kind], index, rotation, reflect)
+        self.trace_worker.expect(len(self.board.cell_dict))
+
+    def unload_level(self):
+        self.speculator.cancel()
+        self.chunk_grid.clear()
+        self.heatmap.clear()
+        self.line_pool.clear()
+        self.label_cache.clear()
+        for item in self.mirror_list + self.start_node_list + self.end_node_list:
+            self.remove(item)
+
+        self.grid_dict = {}
+        self.mirror_list = []
+        self.start_node_list = []
+        self.end_node_list = []
+        self.obs_list = []
+        self.board = None
+        self.end_tracker = None
+        self.trace_result = None
+        self.traced_version = -1
+        self.checking_grid = None
+        self.view_range = None
 
     def spawn_obs(self, index):
-        o = Obstacle(self.matrix[index[0]][index[1]].position, self.grid_scale, index)
-        self.matrix[index[0]][index[1]].item_ins = o
+        # the chunk grid draws obstacles, the cell keeps the board record so it stays occupied
+        o = self.board.place(ObstacleRecord(index))
+        self.put_item(index, o)
         self.obs_list.append(o)
-        self.add(o)
 
     def spawn_mirror(self, c, index, direction, reflect):
-        m = c(self.matrix[index[0]][index[1]].position, self.grid_scale / 1.3, index, direction, reflect, self)
-        self.matrix[index[0]][index[1]].item_ins = m
+        m = c(self.mapper.position(index), self.grid_scale / 1.3, index, direction, reflect, self)
+        self.put_item(index, m)
+        self.board.place(MirrorRecord(index, MIRROR_KIND[c], direction, reflect))
         self.mirror_list.append(m)
         self.add(m)
 
     def spawn_start_node(self, index, direction, color, strength):
-        s = StartNode(self.matrix[index[0]][index[1]].position, self.grid_scale / 1.3, index, direction, color, strength, self)
-        self.matrix[index[0]][index[1]].item_ins = s
+        s = StartNode(self.mapper.position(index), self.grid_scale / 1.3, index, direction, color, strength, self)
+        self.put_item(index, s)
+        self.board.place(StartRecord(index, direction, color, strength))
         self.start_node_list.append(s)
         self.add(s)
 
     def spawn_end_node(self, index, color, goal_strength, direction=-1):
-        e = EndNode(self.matrix[index[0]][index[1]].position, self.grid_scale / 1.3,
+        e = EndNode(self.mapper.position(index), self.grid_scale / 1.3,
                     index, color, goal_strength, self, direction)
-        self.matrix[index[0]][index[1]].item_ins = e
+        self.put_item(index, e)
+        self.board.place(EndRecord(index, color, goal_strength, direction))
         self.end_node_list.append(e)
         self.add(e)
         e.draw_indi()
 
     def get_grid(self, position):
-        for x_i in range(self.grid_count[0]):
-            for y_i in range(self.grid_count[1]):
-                if self.matrix[x_i][y_i].check_clicked((position[0], position[1])):
-                    return self.matrix[x_i][y_i]
-        return None
+        index = self.mapper.index_at(position)
+        if index is None:
+            return None
+        return self.cell_grid(index)
+
+    def cell_grid(self, index):
+        grid = self.grid_dict.get(index)
+        if grid is None:
+            grid = Grid(self.mapper.position(index), index, self)
+        return grid
+
+    def put_item(self, index, item):
+        grid = self.cell_grid(index)
+        grid.item_ins = item
+        self.grid_dict[index] = grid
 
     def on_mouse_press(self, x, y, buttons, modifiers):
-        grid = self.get_grid((x, y))
+        if buttons & mouse.RIGHT:
+            return
+        grid = self.get_grid(self.viewport.to_world((x, y)))
         if grid is None:
             return
         self.checking_grid = grid
@@ -181,9 +275,30 @@ class GameLayer(cocos.layer.Layer):
         if self.checking_grid.item_ins is not None:
             if isinstance(self.checking_grid.item_ins, RotatableMirror):
                 self.checking_grid.item_ins.rotate_mirror()
+            elif isinstance(self.checking_grid.item_ins, MovableMirror):
+                self.start_speculation(grid.index)
+
+    def on_mouse_release(self, x, y, buttons, modifiers):
+        self.speculator.cancel()
+        self.heatmap.clear()
+
+    def start_speculation(self, index):
+        cells = self.board.empty_cells_near(index, int(self.trace_cache.capacity * SPECULATE_SHARE))
+        self.heatmap.clear()
+        self.speculator.start(self.board, index, cells)
+
+    def collect_speculation(self):
+        for cell, cache_key, result in self.speculator.poll():
+            self.trace_cache.store(cache_key, result)
+            self.heatmap.mark(cell, result)
 
     def on_mouse_drag(self, x, y, dx, dy, buttons, modifiers):
-        grid = self.get_grid((x + dx, y + dy))
+        # right button drags the view, left button drags mirrors
+        if buttons & mouse.RIGHT:
+            self.viewport.pan(dx, dy)
+            return
+
+        grid = self.get_grid(self.viewport.to_world((x + dx, y + dy)))
         if grid is None:
             return
 
@@ -195,24 +310,73 @@ class GameLayer(cocos.layer.Layer):
 
                 self.checking_grid = grid
 
+    def on_mouse_scroll(self, x, y, scroll_x, scroll_y):
+        self.viewport.zoom_at((x, y), 1.1 ** scroll_y)
+
+    def on_key_press(self, symbol, modifiers):
+        if symbol == key.ESCAPE and self.menu_scene is not None:
+            director.replace(self.menu_scene)
+            return True
+        # H shows which drop cells satisfy which end nodes while dragging
+        if symbol == key.H:
+            self.show_heatmap = not self.show_heatmap
+            self.heatmap.set_visible(self.show_heatmap)
+            return True
+        if symbol in PAN_KEYS:
+            step = self.screen_size[0] / 10
+            self.viewport.pan(PAN_KEYS[symbol][0] * step, PAN_KEYS[symbol][1] * step)
+            return True
+
     def update_endnode(self):
-        for e in self.end_node_list:
-            e.check_connection()
+        # only end nodes whose total changed are touched, True when this trace cleared the stage
+        was_cleared = self.end_tracker.cleared
+        for index, strength in self.end_tracker.update(self.board, self.trace_result.strengths):
+            self.grid_dict[index].item_ins.set_strength(strength)
+        return self.end_tracker.cleared and not was_cleared
 
     def update_mirror(self):
         for m in self.mirror_list:
             m.draw_indi()
 
     def update(self, dt):
-        self.update_line()
-        self.update_endnode()
+        if self.viewport is not None and self.viewport.changed:
+            self.update_view()
+
+        if self.profiler is None or not self.profiler.active:
+            self.update_board()
+            return
+
+        self.profiler.begin()
+        traced = self.update_board(self.profiler)
+        self.profiler.end(self, traced)
+
+    def update_board(self, profiler=None):
+        if self.board is None:
+            return False
+
+        self.collect_speculation()
+        result = self.collect_trace()
+        if self.board.version != self.traced_version:
+            self.traced_version = self.board.version
+            result = self.request_trace()
+        if result is None:
+            return False
+
+        self.update_line(result)
+        if profiler:
+            profiler.mark("update_line")
+        cleared = self.update_endnode()
+        if profiler:
+            profiler.mark("update_endnode")
         self.update_mirror()
+        if profiler:
+            profiler.mark("update_mirror")
 
-        clear = True
-        for e in self.end_node_list:
-            if e.isActivated is not True:
-                clear = False
+        if cleared:
+            self.on_stage_clear()
+        return True
 
-        if clear:
-            if self.index + 1 <= 3:
-                director.push(self.stages[self.index + 1])
+    def on_stage_clear(self):
+        if self.index + 1 < len(self.stages):
+            # the same layer takes the next stage, nothing piles up on the director
+            self.load_stage(self.index + 1)
@@ -1,6 +1,8 @@
 import cocos
 from cocos.euclid import *
 
+from Board import EPSILON, REFLECT
+
 # direction
 # -1(N) 0(↑) 1(→) 2(↓) 3(←)
 
@@ -10,18 +12,14 @@ def center_position(v1, v2):
 
 
 class Grid:
-    def __init__(self, position, index, master_layer, layer):
+    def __init__(self, position, index, master_layer):
         self.master_layer = master_layer
-        self.layer = layer
         self.index = index
 
         self.position = position
         self.border = {"NW": (position[0] - self.master_layer.grid_size / 2, position[1] + self.master_layer.grid_size / 2),
                        "SE": (position[0] + self.master_layer.grid_size / 2, position[1] - self.master_layer.grid_size / 2)}
 
-        self.box_ins = Box(position, self.master_layer.grid_scale, index, color=(111, 189, 196))
-        self.layer.add(self.box_ins)
-
         self.item_ins = None
 
     def check_clicked(self, check_pos):
@@ -29,10 +27,14 @@ class Grid:
                self.border["NW"][1]
 
     def move_item(self, target_grid):
+        self.master_layer.board.move_item(self.index, target_grid.index)
         target_grid.item_ins = self.item_ins
         target_grid.item_ins.position = target_grid.position
         target_grid.item_ins.index = target_grid.index
         self.item_ins = None
+        # only occupied cells keep their Grid
+        self.master_layer.grid_dict[target_grid.index] = target_grid
+        del self.master_layer.grid_dict[self.index]
 
 
 class Actor(cocos.sprite.Sprite):
@@ -72,37 +74,13 @@ class Mirror(Actor):
             self.rotation = -45
 
     def reflect(self, from_dir):
-        if self.mirror_rotation == -1:
-            if from_dir == 0:
-                return 3
-            elif from_dir == 1:
-                return 2
-            elif from_dir == 2:
-                return 1
-            elif from_dir == 3:
-                return 0
-        else:
-            if from_dir == 0:
-                return 1
-            elif from_dir == 1:
-                return 0
-            elif from_dir == 2:
-                return 3
-            elif from_dir == 3:
-                return 2
+        return REFLECT[self.mirror_rotation][from_dir]
 
     def draw_indi(self):
-        if self.indi:
-            self.GameLayer.remove(self.indi)
-
-        t = cocos.text.Label(str(int(self.reflect_percent)),
-                             position=(self.position[0], self.position[1] - self.GameLayer.grid_size / 3),
-                             font_size=self.GameLayer.grid_size / 8, color=(255, 255, 255, 255),
-                             anchor_x="center", anchor_y="center", bold=True,
-                             font_name="Cascadia Code")
-        self.GameLayer.add(t)
-        self.indi = t
-        return t
+        self.indi = self.GameLayer.label_cache.show(self, str(int(self.reflect_percent)),
+                                                    (self.position[0], self.position[1] - self.GameLayer.grid_size / 3),
+                                                    self.GameLayer.grid_size / 8, (255, 255, 255, 255))
+        return self.indi
 
 
 class MovableMirror(Mirror):
@@ -125,6 +103,7 @@ class RotatableMirror(Mirror):
     def rotate_mirror(self):
         self.do(cocos.actions.RotateBy(90, 0.5))
         self.mirror_rotation *= -1
+        self.GameLayer.board.rotate_mirror(self.index)
 
 
 class StartNode(Actor):
@@ -143,17 +122,11 @@ class StartNode(Actor):
         self.rotation = self.direction * 90
 
     def draw_indi(self):
-        if self.indi:
-            self.GameLayer.remove(self.indi)
-
-        t = cocos.text.Label(str(int(self.strength)),
-                             position=(self.position[0], self.position[1] - self.GameLayer.grid_size / 3),
-                             font_size=self.GameLayer.grid_size / 8, color=(self.color[0], self.color[1], self.color[2], 255),
-                             anchor_x="center", anchor_y="center", bold=True,
-                             font_name="Cascadia Code")
-        self.GameLayer.add(t)
-        self.indi = t
-        return t
+        self.indi = self.GameLayer.label_cache.show(self, str(int(self.strength)),
+                                                    (self.position[0], self.position[1] - self.GameLayer.grid_size / 3),
+                                                    self.GameLayer.grid_size / 8,
+                                                    (self.color[0], self.color[1], self.color[2], 255))
+        return self.indi
 
 
 class EndNode(Actor):
@@ -164,7 +137,6 @@ class EndNode(Actor):
             super(EndNode, self).__init__(position=position, scale=scale, index=index, image='img/endnode.png')
         self.activated_color = color
         self.isActivated = False
-        self.isConnected = False
         self.index = index
         self.line_list = []
         self.direction = direction
@@ -175,12 +147,10 @@ class EndNode(Actor):
 
         self.init_direction()
 
-    def add_strength(self, add):
-        self.isConnected = True
-        self.current_strength += add
+    def set_strength(self, strength):
+        self.current_strength = strength
         self.draw_indi()
         self.check_is_activated()
-        self.current_strength -= add
 
     def init_direction(self):
         self.rotation = self.direction * 90
@@ -189,42 +159,58 @@ class EndNode(Actor):
         self.color = self.activated_color
         self.isActivated = True
 
+    def deactivated(self):
+        self.color = (255, 255, 255)
+        self.isActivated = False
+
     def check_is_activated(self):
-        if self.current_strength == self.goal_strength:
+        if abs(self.current_strength - self.goal_strength) <= EPSILON:
             self.activated()
-
-    def check_connection(self):
-        if self.isConnected:
-            self.isConnected = False
         else:
-            self.draw_indi()
+            self.deactivated()
 
     def draw_indi(self):
-        if self.indi:
-            self.GameLayer.remove(self.indi)
+        # both numbers through %g, a strength within EPSILON of the goal shows as the goal so a met node reads as met
+        current = self.current_strength
+        if abs(current - self.goal_strength) <= EPSILON:
+            current = self.goal_strength
+        self.indi = self.GameLayer.label_cache.show(self, "%g  %g" % (current, self.goal_strength),
+                                                    (self.position[0], self.position[1] - self.GameLayer.grid_size / 3),
+                                                    self.GameLayer.grid_size / 8,
+                                                    (self.activated_color[0], self.activated_color[1], self.activated_color[2], 255))
+        return self.indi
 
-        t = cocos.text.Label(str(int(self.current_strength)) + "  " + str(self.goal_strength),
-                             position=(self.position[0], self.position[1] - self.GameLayer.grid_size / 3),
-                             font_size=self.GameLayer.grid_size / 8, color=(self.activated_color[0], self.activated_color[1], self.activated_color[2], 255),
-                             anchor_x="center", anchor_y="center", bold=True,
-                             font_name="Cascadia Code")
 
-        self.GameLayer.add(t)
-        self.indi = t
+class Line(cocos.sprite.Sprite):
+    def __init__(self, GameLayer):
+        super(Line, self).__init__(scale=GameLayer.grid_scale, image='img/Line.png')
+        self.GameLayer = GameLayer
+        self.from_index = (-1, -1)
+        self.to_index = (-1, -1)
+        self.strength = 0
+        self.segment = None
 
+    def set_segment(self, from_pos, to_pos, color, strength, from_index=(-1, -1), to_index=(-1, -1)):
+        self.from_index = from_index
+        self.to_index = to_index
+        self.strength = strength
+
+        # pooled lines are reused every frame, only touch the sprite when the segment really changed
+        segment = (from_pos, to_pos, color, strength)
+        if segment == self.segment:
+            return
+        self.segment = segment
 
-class Line(cocos.sprite.Sprite):
-    def __init__(self, from_pos, to_pos, color, strength, GameLayer, from_index=(-1, -1), to_index=(-1, -1)):
         rotation = 0
+        length = abs(to_pos[0] - from_pos[0])
         if from_pos[1] != to_pos[1]:
             rotation = 90
-        super(Line, self).__init__(position=center_position(from_pos, to_pos),
-                                   scale=GameLayer.grid_scale,
-                                   color=color,
-                                   rotation=rotation, image='img/Line.png')
-        self.scale_y = min(1, max(0.4, strength / 80))
-        self.GameLayer = GameLayer
-        self.from_index = from_index
-        self.to_index = to_index
+            length = abs(to_pos[1] - from_pos[1])
+        # the texture spans two cell steps, overlapping half a step past both ends
+        steps = length / (self.GameLayer.grid_size + self.GameLayer.gap_size)
+
+        self.position = center_position(from_pos, to_pos)
+        self.rotation = rotation
         self.color = color
-        self.strength = strength
+        self.scale_x = (steps + 1) / 2
+        self.scale_y = min(1, max(0.4, strength / 80))
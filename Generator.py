@@ -0,0 +1,173 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from Board import *
+from Level import Level, dump_level, parse_color
+from Solver import lit_cells, solve
+
+DIFFICULTY = {"easy": {"pieces": 2, "rotatables": 0, "obstacles": 2, "partial": 0.0},
+              "normal": {"pieces": 3, "rotatables": 1, "obstacles": 4, "partial": 0.2},
+              "hard": {"pieces": 5, "rotatables": 2, "obstacles": 6, "partial": 0.4}}
+
+PARTIAL_PERCENTS = (50, 60, 70, 80, 90)
+
+
+class GeneratorConfig:
+    def __init__(self, grid_count=(6, 6), colors=(RED,), pieces=3, rotatables=1, obstacles=4, partial=0.2,
+                 unique=False, min_nodes=0, max_nodes=20000):
+        self.grid_count = tuple(grid_count)
+        self.colors = tuple(tuple(c) for c in colors)
+        self.pieces = pieces
+        self.rotatables = rotatables
+        self.obstacles = obstacles
+        self.partial = partial
+        self.unique = unique
+        self.min_nodes = min_nodes
+        self.max_nodes = max_nodes
+
+
+def grow_mirror(board, rng, kind, partial):
+    # the intended solution is grown along the beams, so every mirror starts out in use
+    lit = lit_cells(board, trace(board))[0]
+    if not lit:
+        return False
+    reflect = rng.choice(PARTIAL_PERCENTS) if rng.random() < partial else 100
+    board.place(MirrorRecord(rng.choice(sorted(lit)), kind, rng.choice((-1, 1)), reflect))
+    return True
+
+
+def place_end_node(board, rng, color):
+    lit = lit_cells(board, trace(board))[0]
+    candidates = sorted((index, direction) for index, beams in lit.items() for direction, c in beams if c == color)
+    if not candidates:
+        return False
+    index, direction = rng.choice(candidates)
+    board.place(EndRecord(index, color, 0, rng.choice((-1, (direction + 2) % 4))))
+    return True
+
+
+def generate(seed, config):
+    # returns (Level, solve stats) or None when the board came out unsolvable or trivial
+    rng = random.Random(seed)
+    board = Board(config.grid_count)
+    free = [(x, y) for x in range(config.grid_count[0]) for y in range(config.grid_count[1])]
+    rng.shuffle(free)
+
+    try:
+        for color in config.colors:
+            board.place(StartRecord(free.pop(), rng.randrange(4), color, 100))
+        for _ in range(config.obstacles):
+            board.place(ObstacleRecord(free.pop()))
+
+        for kind, count in ((ROTATABLE, config.rotatables), (MOVABLE, config.pieces)):
+            for _ in range(count):
+                if not grow_mirror(board, rng, kind, config.partial):
+                    return None
+        for color in config.colors:
+            if not place_end_node(board, rng, color):
+                return None
+
+        result = trace(board)
+        hits = lit_cells(board, result)[1]
+        if any(m.index not in hits for m in board.mirror_list):
+            return None
+        for e in board.end_node_list:
+            if result.strengths[e.index] <= EPSILON:
+                return None
+            # rounded far inside EPSILON, so the goal stays reachable and 5.399999999999999 is written as 5.4
+            e.goal_strength = round(result.strengths[e.index], 9)
+
+        # scramble the solved board into the puzzle
+        empty = [index for index in free if board.get(index) is None]
+        rng.shuffle(empty)
+        for m in list(board.mirror_list):
+            if m.kind == MOVABLE:
+                target = empty.pop()
+                empty.append(m.index)
+                board.move_item(m.index, target)
+            elif m.kind == ROTATABLE and rng.random() < 0.5:
+                board.rotate_mirror(m.index)
+        if is_cleared(board, trace(board).strengths):
+            return None
+    except IndexError:
+        return None
+
+    solved = solve(board, limit=2 if config.unique else 1, processes=1, max_nodes=config.max_nodes)
+    if not solved.solvable or (config.unique and not (solved.unique and solved.stats.complete)):
+        return None
+    if solved.stats.nodes < config.min_nodes:
+        return None
+    return Level.from_board(board), solved.stats
+
+
+def _generate_task(task):
+    seed, config = task
+    generated = generate(seed, config)
+    if generated is None:
+        return seed, None, 0
+    level, stats = generated
+    return seed, dump_level(level), stats.nodes
+
+
+def run(config, count, out_dir, processes=None, seed=0, batch=256, max_rejects=5000):
+    # accepted levels are written as soon as a worker hands them back, gives up once max_rejects boards
+    # in a row were rejected, a config that never yields a level would otherwise run forever
+    os.makedirs(out_dir, exist_ok=True)
+    start_time = time.perf_counter()
+    accepted = 0
+    tried = 0
+    rejected = 0
+    seeds = itertools.count(seed)
+
+    with multiprocessing.Pool(processes) as pool:
+        while accepted < count and rejected < max_rejects:
+            task_list = [(next(seeds), config) for _ in range(batch)]
+            for level_seed, text, nodes in pool.imap_unordered(_generate_task, task_list):
+                tried += 1
+                if text is None:
+                    rejected += 1
+                    if rejected >= max_rejects:
+                        break
+                    continue
+                rejected = 0
+                path = os.path.join(out_dir, "stage_%05d.lvl" % accepted)
+                with open(path, "w") as f:
+                    f.write("# seed %d, solver nodes %d\n" % (level_seed, nodes))
+                    f.write(text)
+                accepted += 1
+                if accepted >= count:
+                    break
+
+    return accepted, tried, time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate solvable Reflect level files.")
+    parser.add_argument("count", type=int)
+    parser.add_argument("--out", default="generated")
+    parser.add_argument("--size", type=int, nargs=2, default=(6, 6), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--colors", nargs="+", default=["RED"], help="RED, PINK, YELLOW or r,g,b")
+    parser.add_argument("--difficulty", choices=sorted(DIFFICULTY), default="normal")
+    parser.add_argument("--unique", action="store_true", help="only keep stages with a single solution")
+    parser.add_argument("--min-nodes", type=int, default=0, help="drop stages the solver clears in fewer nodes")
+    parser.add_argument("--max-nodes", type=int, default=20000, help="drop stages the solver cannot settle in this many")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-rejects", type=int, default=5000,
+                        help="give up after this many boards in a row were rejected")
+    args = parser.parse_args()
+
+    config = GeneratorConfig(args.size, [parse_color(c) for c in args.colors], unique=args.unique,
+                             min_nodes=args.min_nodes, max_nodes=args.max_nodes, **DIFFICULTY[args.difficulty])
+    accepted, tried, elapsed = run(config, args.count, args.out, args.processes, args.seed,
+                                   max_rejects=args.max_rejects)
+    print("%d level(s) from %d board(s) in %.1fs -> %s" % (accepted, tried, elapsed, args.out))
+    if accepted < args.count:
+        print("FAIL gave up after %d boards in a row were rejected, only %d of %d level(s) generated" % (
+            args.max_rejects, accepted, args.count))
+        sys.exit(1)
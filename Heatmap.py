@@ -0,0 +1,35 @@
+import cocos.batch
+
+from Board import EPSILON
+from GameObject import Box
+
+
+class Heatmap:
+    # tints drop cells by the end nodes a dragged mirror would satisfy there, stronger when it satisfies more,
+    # only filled while a drag is speculated
+    def __init__(self, GameLayer):
+        self.GameLayer = GameLayer
+        self.batch = cocos.batch.BatchNode()
+        self.batch.visible = False
+        GameLayer.grid_layer.add(self.batch, z=1)
+        self.box_dict = {}
+
+    def set_visible(self, visible):
+        self.batch.visible = visible
+
+    def mark(self, index, result):
+        layer = self.GameLayer
+        end_list = layer.board.end_node_list
+        met = [e for e in end_list if abs(result.strengths[e.index] - e.goal_strength) <= EPSILON]
+        if not met or index in self.box_dict:
+            return
+
+        box = Box(layer.mapper.position(index), layer.grid_scale, index, color=met[0].color)
+        box.opacity = int(80 + 175 * len(met) / len(end_list))
+        self.batch.add(box)
+        self.box_dict[index] = box
+
+    def clear(self):
+        for box in self.box_dict.values():
+            self.batch.remove(box)
+        self.box_dict.clear()
@@ -0,0 +1,218 @@
+import argparse
+import gc
+import sys
+import tracemalloc
+
+import pyglet
+
+FRAME_DT = 1 / 60
+# frames run before measuring, the pools and caches fill up and every per-frame counter (board version, cache
+# misses, relayouts, beams kept) climbs past 256 and out of CPython's small int cache, a counter still inside it
+# allocates a new int each time it grows and shows up as a leaked block
+WARMUP = 300
+
+
+def live_nodes():
+    # every cocos node still alive by class, attached or not, so sprites dropped from a layer but still
+    # referenced somewhere show up too
+    from cocos.cocosnode import CocosNode
+
+    gc.collect()
+    # counted here rather than with a Counter, so even the counts are allocated in this file and filtered out
+    counts = {}
+    for o in gc.get_objects():
+        if isinstance(o, CocosNode):
+            name = type(o).__name__
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+class AllocTracker:
+    # tracemalloc around GameLayer frames, net and transient bytes per frame, and what grew over the window
+    def __init__(self, depth=1):
+        self.depth = depth
+        self.started_tracing = False
+
+        self.start_snapshot = None
+        self.start_nodes = {}
+        self.frame_start = 0
+        self.frame_count = 0
+        # summed over the frames since start()
+        self.net_bytes = 0
+        self.transient_bytes = 0
+
+    def start(self):
+        # objects allocated before tracing began are invisible, so churning them looks like growth,
+        # start well before the window that is reported
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.depth)
+            self.started_tracing = True
+        self.reset()
+
+    def reset(self):
+        # opens a new window, report() covers everything after this
+        self.start_snapshot = None
+        gc.collect()
+        # the first filtered snapshot fills fnmatch's pattern cache, which would otherwise count as growth
+        self.snapshot()
+        self.start_snapshot = self.snapshot()
+        self.start_nodes = live_nodes()
+        self.frame_count = 0
+        self.net_bytes = 0
+        self.transient_bytes = 0
+
+    def stop(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def snapshot(self):
+        # the harness, tracemalloc and the clock driving the frames are left out
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                                          tracemalloc.Filter(False, __file__),
+                                                          tracemalloc.Filter(False, pyglet.clock.__file__)))
+
+    def begin_frame(self):
+        tracemalloc.reset_peak()
+        self.frame_start = tracemalloc.get_traced_memory()[0]
+
+    def end_frame(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.net_bytes += current - self.frame_start
+        self.transient_bytes += peak - self.frame_start
+        self.frame_count += 1
+
+    def attach(self, layer, every=600):
+        # swaps the layer's scheduled update for a tracked one, prints a report every `every` frames
+        def update(dt):
+            self.begin_frame()
+            layer.update(dt)
+            self.end_frame()
+            if self.frame_count >= every:
+                print(format_report(self.report()))
+                self.reset()
+
+        layer.unschedule(layer.update)
+        layer.schedule(update)
+        self.start()
+
+    def report(self, top=10):
+        # collected and taken before counting nodes, like the start snapshot
+        gc.collect()
+        diff = self.snapshot().compare_to(self.start_snapshot, "lineno")
+        nodes = live_nodes()
+        frames = max(1, self.frame_count)
+        return {"frames": self.frame_count,
+                "net_bytes_per_frame": self.net_bytes / frames,
+                "transient_bytes_per_frame": self.transient_bytes / frames,
+                "net_bytes": sum(stat.size_diff for stat in diff),
+                "net_blocks": sum(stat.count_diff for stat in diff),
+                "nodes": dict(nodes),
+                "node_growth": {name: nodes.get(name, 0) - self.start_nodes.get(name, 0)
+                                for name in nodes.keys() | self.start_nodes.keys()
+                                if nodes.get(name, 0) != self.start_nodes.get(name, 0)},
+                "top": [(str(stat.traceback[0]), stat.size_diff, stat.count_diff)
+                        for stat in diff[:top] if stat.size_diff or stat.count_diff]}
+
+
+def format_report(report):
+    lines = ["%d frames : %+.1f B net, %.1f B transient per frame, %+d B in %+d blocks overall" % (
+        report["frames"], report["net_bytes_per_frame"], report["transient_bytes_per_frame"],
+        report["net_bytes"], report["net_blocks"])]
+    for name in ("Line", "Label") + tuple(sorted(set(report["nodes"]) - {"Line", "Label"})):
+        if name in report["nodes"]:
+            lines.append("  %-16s %6d live %+6d" % (name, report["nodes"][name], report["node_growth"].get(name, 0)))
+    for where, size_diff, count_diff in report["top"]:
+        lines.append("  %+8d B %+5d blocks  %s" % (size_diff, count_diff, where))
+    return "\n".join(lines)
+
+
+def run(layer, frames, warmup=WARMUP, step=None, tracker=None, threaded=False):
+    # drives the layer on a clock of its own without a window, so its update and the sprites' actions
+    # advance exactly FRAME_DT per frame, warmup frames fill the pools and caches before measuring,
+    # step(layer, frame) is called before every frame to script changes to the board.
+    # Traces stay on the main thread unless threaded, otherwise tracemalloc's slowdown hands them to the
+    # worker and what is in flight when the window closes decides the numbers.
+    if not threaded:
+        layer.trace_worker.async_time = float("inf")
+
+    now = [0.0]
+    clock = pyglet.clock.Clock(time_function=lambda: now[0])
+    default_clock = pyglet.clock.get_default()
+    pyglet.clock.set_default(clock)
+    layer.on_enter()
+
+    def frame(i):
+        if step is not None:
+            step(layer, i)
+        now[0] += FRAME_DT
+        clock.tick()
+
+    tracker = tracker or AllocTracker()
+    tracker.start()
+    try:
+        for i in range(warmup):
+            frame(i)
+
+        tracker.reset()
+        try:
+            for i in range(warmup, warmup + frames):
+                tracker.begin_frame()
+                frame(i)
+                tracker.end_frame()
+            return tracker.report()
+        finally:
+            tracker.stop()
+    finally:
+        layer.on_exit()
+        pyglet.clock.set_default(default_clock)
+
+
+def rotatable_mirrors(layer):
+    from GameObject import RotatableMirror
+
+    return [m for m in layer.mirror_list if isinstance(m, RotatableMirror)]
+
+
+def rotate_mirrors(layer, frame):
+    # turns a rotatable mirror through its sprite on even frames and back on odd ones, a different mirror
+    # every pair, with the trace cache emptied so each frame really traces, renders and relabels,
+    # every 2 * len(rotatable_mirrors(layer)) frames the board and the way it got there repeat
+    rotatable = rotatable_mirrors(layer)
+    if rotatable:
+        rotatable[frame // 2 % len(rotatable)].rotate_mirror()
+    layer.trace_cache.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Track allocations and live cocos nodes across GameLayer frames.")
+    parser.add_argument("level", nargs="?", help="level file, a synthetic board is built when left out")
+    parser.add_argument("--size", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--warmup", type=int, default=WARMUP,
+                        help="frames before measuring, --strict needs the counters out of the small int cache, "
+                             "which fewer than the default may not get them")
+    parser.add_argument("--rotate", action="store_true", help="turn a rotatable mirror and re-trace every frame")
+    parser.add_argument("--threaded", action="store_true", help="let slow traces go to the worker thread")
+    parser.add_argument("--strict", action="store_true", help="fail unless memory and node counts stay flat")
+    parser.add_argument("--headless", action="store_true", help="use pyglet's headless backend")
+    args = parser.parse_args()
+
+    from Benchmark import build_layer, build_level, init_headless
+    from Level import load_level
+
+    init_headless(args.headless)
+    level = load_level(args.level) if args.level else build_level(args.size, 0.2, 0.3, 0)
+    layer = build_layer(level)
+    step = None
+    if args.rotate:
+        step = rotate_mirrors
+        # whole rotation cycles, so the window ends in the same state it started in, shared tuples included
+        period = max(1, 2 * len(rotatable_mirrors(layer)))
+        args.warmup = -(-args.warmup // period) * period
+        args.frames = -(-args.frames // period) * period
+    report = run(layer, args.frames, args.warmup, step, threaded=args.threaded)
+    print(format_report(report))
+
+    if args.strict and (report["net_blocks"] > 0 or report["node_growth"]):
+        sys.exit(1)
@@ -0,0 +1,164 @@
+from Board import *
+
+# level file, one item per line, '#' starts a comment
+#   size <width> <height>
+#   start <x> <y> <direction> <color> <strength>
+#   end <x> <y> <color> <goal_strength> [direction]
+#   obs <x> <y>
+#   mirror <movable|static|rotatable> <x> <y> <rotation> <reflect_percent>
+# color is RED, PINK, YELLOW or r,g,b
+
+COLOR_NAME = {"RED": RED,
+              "PINK": PINK,
+              "YELLOW": YELLOW}
+
+KIND_NAME = {"movable": MOVABLE,
+             "static": STATIC,
+             "rotatable": ROTATABLE}
+
+
+class Level:
+    def __init__(self, grid_count):
+        self.grid_count = tuple(grid_count)
+        self.start_list = []   # (index, direction, color, strength)
+        self.end_list = []     # (index, color, goal_strength, direction)
+        self.obs_list = []     # index
+        self.mirror_list = []  # (kind, index, rotation, reflect_percent)
+
+    def build_board(self):
+        board = Board(self.grid_count)
+        for index, direction, color, strength in self.start_list:
+            board.place(StartRecord(index, direction, color, strength))
+        for index, color, goal_strength, direction in self.end_list:
+            board.place(EndRecord(index, color, goal_strength, direction))
+        for index in self.obs_list:
+            board.place(ObstacleRecord(index))
+        for kind, index, rotation, reflect in self.mirror_list:
+            board.place(MirrorRecord(index, kind, rotation, reflect))
+        return board
+
+    @classmethod
+    def from_board(cls, board):
+        level = cls(board.grid_count)
+        for s in board.start_node_list:
+            level.start_list.append((s.index, s.direction, s.color, s.strength))
+        for e in board.end_node_list:
+            level.end_list.append((e.index, e.color, e.goal_strength, e.direction))
+        for o in board.obs_list:
+            level.obs_list.append(o.index)
+        for m in board.mirror_list:
+            level.mirror_list.append((m.kind, m.index, m.rotation, m.reflect_percent))
+        return level
+
+
+def parse_number(text):
+    value = float(text)
+    if value.is_integer():
+        return int(value)
+    return value
+
+
+def parse_choice(text, what, choices):
+    # an int that has to be one of choices, anything else would only fail later inside trace()
+    value = int(text)
+    if value not in choices:
+        raise ValueError("%s %d is not one of %s" % (what, value, ", ".join(str(c) for c in choices)))
+    return value
+
+
+def parse_percent(text):
+    value = parse_number(text)
+    if not 0 <= value <= 100:
+        raise ValueError("reflect percent %s is outside 0..100" % text)
+    return value
+
+
+def parse_color(text):
+    if text in COLOR_NAME:
+        return COLOR_NAME[text]
+    return tuple(int(c) for c in text.split(","))
+
+
+def format_color(color):
+    for name, value in COLOR_NAME.items():
+        if value == tuple(color):
+            return name
+    return ",".join(str(c) for c in color)
+
+
+def format_number(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def parse_level(text, name="<level>"):
+    level = None
+    # cell -> line that put an item there, a second item would corrupt the board's column and row lists
+    used = {}
+    for line_no, line in enumerate(text.splitlines(), 1):
+        words = line.split("#", 1)[0].split()
+        if not words:
+            continue
+
+        try:
+            tag = words[0]
+            if tag == "size":
+                level = Level((int(words[1]), int(words[2])))
+                used = {}
+                continue
+            if level is None:
+                raise ValueError("'size' must come first")
+
+            index = (int(words[1]), int(words[2])) if tag != "mirror" else (int(words[2]), int(words[3]))
+            if not (0 <= index[0] < level.grid_count[0] and 0 <= index[1] < level.grid_count[1]):
+                raise ValueError("cell %d,%d is outside the %dx%d board" % (index + level.grid_count))
+            if index in used:
+                raise ValueError("cell %d,%d is already used on line %d" % (index + (used[index],)))
+            used[index] = line_no
+            if tag == "start":
+                level.start_list.append((index, parse_choice(words[3], "direction", range(4)),
+                                         parse_color(words[4]), parse_number(words[5])))
+            elif tag == "end":
+                direction = parse_choice(words[5], "direction", range(-1, 4)) if len(words) > 5 else -1
+                level.end_list.append((index, parse_color(words[3]), parse_number(words[4]), direction))
+            elif tag == "obs":
+                level.obs_list.append(index)
+            elif tag == "mirror":
+                level.mirror_list.append((KIND_NAME[words[1]], index, parse_choice(words[4], "rotation", (-1, 1)),
+                                          parse_percent(words[5])))
+            else:
+                raise ValueError("unknown item '%s'" % tag)
+        except (IndexError, KeyError, ValueError) as e:
+            raise ValueError("%s:%d: %s" % (name, line_no, e)) from None
+
+    if level is None:
+        raise ValueError("%s: missing 'size'" % name)
+    return level
+
+
+def dump_level(level):
+    kind_name = {kind: name for name, kind in KIND_NAME.items()}
+    lines = ["size %d %d" % level.grid_count]
+    for index, direction, color, strength in level.start_list:
+        lines.append("start %d %d %d %s %s" % (index[0], index[1], direction, format_color(color), format_number(strength)))
+    for index, color, goal_strength, direction in level.end_list:
+        line = "end %d %d %s %s" % (index[0], index[1], format_color(color), format_number(goal_strength))
+        if direction != -1:
+            line += " %d" % direction
+        lines.append(line)
+    for index in level.obs_list:
+        lines.append("obs %d %d" % index)
+    for kind, index, rotation, reflect in level.mirror_list:
+        lines.append("mirror %s %d %d %d %s" % (kind_name[kind], index[0], index[1], rotation, format_number(reflect)))
+    return "\n".join(lines) + "\n"
+
+
+def load_level(path):
+    with open(path) as f:
+        return parse_level(f.read(), path)
+
+
+def save_level(level, path):
+    with open(path, "w") as f:
+        f.write(dump_level(level))
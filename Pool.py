@@ -0,0 +1,174 @@
+from collections import OrderedDict
+
+import cocos
+import cocos.batch
+
+from GameObject import *
+
+
+class LinePool:
+    def __init__(self, GameLayer, layer):
+        self.GameLayer = GameLayer
+        self.batch = cocos.batch.BatchNode()
+        layer.add(self.batch)
+
+        self.line_list = []
+        # (from_index, to_index, color) -> the line drawing that run
+        self.line_dict = {}
+        self.spare_list = []
+        self.active_count = 0
+        # sprites constructed over the pool's lifetime
+        self.created = 0
+
+    def create(self):
+        l = Line(self.GameLayer)
+        self.batch.add(l)
+        self.created += 1
+        self.line_list.append(l)
+        return l
+
+    def set_scale(self, scale):
+        # a new stage may have another cell size
+        for l in self.line_list:
+            l.scale = scale
+            l.segment = None
+
+    def render(self, segments):
+        # runs that were already drawn keep their line, so a partial re-trace only touches the lines it changed
+        line_dict = {}
+        fresh = []
+        for segment in segments:
+            l = self.line_dict.pop(segment[:3], None)
+            if l is None:
+                fresh.append(segment)
+            else:
+                self.set_segment(l, segment)
+                line_dict[segment[:3]] = l
+
+        # lines of runs that are gone take the new runs first, hidden spares after them
+        left = list(self.line_dict.values())
+        for segment in fresh:
+            if left:
+                l = left.pop()
+            elif self.spare_list:
+                l = self.spare_list.pop()
+            else:
+                l = self.create()
+            self.set_segment(l, segment)
+            if not l.visible:
+                l.visible = True
+            line_dict[segment[:3]] = l
+
+        # spare lines stay in the batch hidden, ready for the next trace
+        for l in left:
+            l.visible = False
+            self.spare_list.append(l)
+        self.line_dict = line_dict
+        self.active_count = len(line_dict)
+
+    def set_segment(self, l, segment):
+        from_index, to_index, color, strength = segment
+        l.set_segment(self.GameLayer.index_position(from_index), self.GameLayer.index_position(to_index),
+                      color, strength, from_index, to_index)
+
+    def clear(self):
+        self.render(())
+
+
+class LabelCache:
+    def __init__(self, layer, capacity=64):
+        self.layer = layer
+        self.capacity = capacity
+
+        # owner -> [key, label], key : (text, font_size, color)
+        self.owner_dict = {}
+        # key -> spare labels, least recently released first
+        self.free_dict = OrderedDict()
+        self.free_count = 0
+
+        # labels constructed and labels laid out again over the cache's lifetime
+        self.created = 0
+        self.relayout_count = 0
+
+    def show(self, owner, text, position, font_size, color):
+        if not self.layer.in_view(owner.index):
+            # culled by the viewport, the label comes back when the owner scrolls into view
+            self.release(owner)
+            return None
+
+        key = (text, font_size, color)
+        entry = self.owner_dict.get(owner)
+
+        if entry is None:
+            label = self.take(key)
+            if label is None:
+                label = self.create(text, font_size, color)
+            entry = [key, label]
+            self.owner_dict[owner] = entry
+        elif entry[0] != key:
+            label = self.take(key)
+            if label is None:
+                # no spare label already laid out with this value, so update the owned one in place
+                label = entry[1]
+                self.relayout(label, entry[0], key)
+            else:
+                self.free(entry[0], entry[1])
+            entry[0] = key
+            entry[1] = label
+
+        label = entry[1]
+        if tuple(label.position) != tuple(position):
+            label.position = position
+        return label
+
+    def release(self, owner):
+        entry = self.owner_dict.pop(owner, None)
+        if entry is not None:
+            self.free(entry[0], entry[1])
+
+    def clear(self):
+        for owner in list(self.owner_dict):
+            self.release(owner)
+
+    def create(self, text, font_size, color):
+        label = cocos.text.Label(text, font_size=font_size, color=color,
+                                 anchor_x="center", anchor_y="center", bold=True,
+                                 font_name="Cascadia Code")
+        self.layer.add(label)
+        self.created += 1
+        return label
+
+    def relayout(self, label, old_key, key):
+        self.relayout_count += 1
+        if old_key[1] != key[1]:
+            label.element.font_size = key[1]
+        if old_key[2] != key[2]:
+            label.element.color = key[2]
+        if old_key[0] != key[0]:
+            label.element.text = key[0]
+
+    def take(self, key):
+        label_list = self.free_dict.get(key)
+        if not label_list:
+            return None
+
+        label = label_list.pop()
+        if not label_list:
+            del self.free_dict[key]
+        self.free_count -= 1
+        label.visible = True
+        return label
+
+    def free(self, key, label):
+        label.visible = False
+        self.free_dict.setdefault(key, []).append(label)
+        self.free_dict.move_to_end(key)
+        self.free_count += 1
+
+        # evict spare labels of the least recently used values
+        while self.free_count > self.capacity:
+            old_key, label_list = next(iter(self.free_dict.items()))
+            self.layer.remove(label_list.pop(0))
+            if not label_list:
+                del self.free_dict[old_key]
+            self.free_count -= 1
@@ -0,0 +1,165 @@
+import os
+import time
+
+import cocos
+from pyglet.window import key
+
+from Board import STATIC
+
+SECTIONS = ("update_line", "update_endnode", "update_mirror")
+CSV_COLUMNS = ("time", "stage", "board_version", "frame_ms") + tuple(s + "_ms" for s in SECTIONS) + \
+              ("trace_runs", "trace_depth", "lines", "labels", "board_state")
+
+
+class CsvLog:
+    # rows are buffered and written in blocks, the file rolls over to path.1 .. path.N past max_bytes
+    def __init__(self, path, max_bytes=4 * 1024 * 1024, backup_count=3, buffer_rows=120):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.buffer_rows = buffer_rows
+        self.rows = []
+        self.file = None
+        self.open()
+
+    def open(self):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = open(self.path, "a")
+        if new:
+            self.file.write(",".join(CSV_COLUMNS) + "\n")
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists("%s.%d" % (self.path, i)):
+                os.replace("%s.%d" % (self.path, i), "%s.%d" % (self.path, i + 1))
+        os.replace(self.path, self.path + ".1")
+        self.open()
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.file.write("".join(",".join(str(v) for v in row) + "\n" for row in self.rows))
+        self.file.flush()
+        self.rows.clear()
+        if self.file.tell() > self.max_bytes:
+            self.rotate()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class FrameProfiler:
+    def __init__(self, log_path=None):
+        self.enabled = False
+        self.log = CsvLog(log_path) if log_path else None
+
+        self.frame_start = 0
+        self.section_start = 0
+        self.sections = dict.fromkeys(SECTIONS, 0)
+        # the last frame that actually re-traced, idle frames leave it alone
+        self.last_sections = dict.fromkeys(SECTIONS, 0)
+        self.frame_time = 0
+        self.frame_count = 0
+        self.traced_count = 0
+
+    @property
+    def active(self):
+        return self.enabled or self.log is not None
+
+    def begin(self):
+        self.frame_start = self.section_start = time.perf_counter()
+        for name in SECTIONS:
+            self.sections[name] = 0
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.sections[name] = now - self.section_start
+        self.section_start = now
+
+    def end(self, layer, traced):
+        self.frame_time = time.perf_counter() - self.frame_start
+        self.frame_count += 1
+        if traced:
+            self.traced_count += 1
+            self.last_sections.update(self.sections)
+
+        if self.log is not None:
+            result = layer.trace_result
+            # a cleared stage swaps the next one in mid frame, it has not been traced yet
+            traced = traced and result is not None
+            self.log.write((round(time.time(), 3), layer.index, layer.board.version,
+                            round(self.frame_time * 1000, 4)) +
+                           tuple(round(self.sections[name] * 1000, 4) for name in SECTIONS) +
+                           (result.calls if traced else "", result.depth if traced else "",
+                            layer.line_pool.active_count, len(layer.label_cache.owner_dict),
+                            board_state(layer.board) if traced else ""))
+
+
+def board_state(board):
+    # the mirrors a player can change, enough to rebuild the board from its level file
+    return " ".join("%d:%d:%d" % (m.index[0], m.index[1], m.rotation) for m in board.mirror_list if m.kind != STATIC)
+
+
+class ProfilerHUD(cocos.layer.Layer):
+    is_event_handler = True
+
+    def __init__(self, game_layer, profiler):
+        super(ProfilerHUD, self).__init__()
+        self.game_layer = game_layer
+        self.profiler = profiler
+        self.visible = False
+
+        self.label = cocos.text.Label("", position=(10, game_layer.screen_size[1] - 10), font_size=12,
+                                      color=(0, 0, 0, 255), anchor_x="left", anchor_y="top",
+                                      multiline=True, width=500, font_name="Cascadia Code")
+        self.add(self.label)
+
+    def on_enter(self):
+        super(ProfilerHUD, self).on_enter()
+        # the profiler is shared by every stage, so a stage entered later picks up the current toggle
+        self.show(self.profiler.enabled)
+
+    def on_exit(self):
+        self.unschedule(self.refresh)
+        super(ProfilerHUD, self).on_exit()
+
+    def show(self, enabled):
+        self.visible = enabled
+        self.profiler.enabled = enabled
+        self.unschedule(self.refresh)
+        if enabled:
+            self.schedule_interval(self.refresh, 0.25)
+            self.refresh(0)
+
+    def on_key_press(self, symbol, modifiers):
+        if symbol == key.F3:
+            self.show(not self.visible)
+            return True
+
+    def refresh(self, dt):
+        p = self.profiler
+        result = self.game_layer.trace_result
+        lines = ["%-14s %7.3f ms" % ("frame", p.frame_time * 1000)]
+        for name in SECTIONS:
+            lines.append("%-14s %7.3f ms" % (name, p.last_sections[name] * 1000))
+        lines.append("trace        %d runs, depth %d" % (result.calls, result.depth) if result else "trace        -")
+        lines.append("Line sprites %d / %d" % (self.game_layer.line_pool.active_count,
+                                               len(self.game_layer.line_pool.line_list)))
+        lines.append("labels       %d" % len(self.game_layer.label_cache.owner_dict))
+        lines.append("grid sprites %d in %d chunks" % (self.game_layer.chunk_grid.sprite_count(),
+                                                      len(self.game_layer.chunk_grid.chunk_dict)))
+        lines.append("trace cache  %d hits, %d misses" % (self.game_layer.trace_cache.hits,
+                                                        self.game_layer.trace_cache.misses))
+        lines.append("beams        %d traced, %d kept" % (self.game_layer.path_index.retraced,
+                                                        self.game_layer.path_index.kept))
+        lines.append("trace worker %d sent, %d dropped" % (self.game_layer.trace_worker.submitted,
+                                                      self.game_layer.trace_worker.dropped))
+        lines.append("traced       %d / %d frames" % (p.traced_count, p.frame_count))
+        self.label.element.text = "\n".join(lines)
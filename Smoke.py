@@ -0,0 +1,70 @@
+import argparse
+import glob
+import sys
+
+FRAMES = 5
+FRAME_DT = 1 / 60
+
+
+def check_stages(path_list):
+    # loads every stage into one GameLayer the way the game does, clearing each one to advance to the next,
+    # returns the problems found
+    import cocos
+    from GameLayer import GameLayer
+    from GameObject import MovableMirror
+    from main import StageLoader
+
+    stages = StageLoader(path_list)
+    layer = GameLayer(cocos.layer.Layer(), cocos.layer.Layer(), stages, 0)
+    problems = []
+    index = 0
+    layer.load_stage(0)
+    while True:
+        for _ in range(FRAMES):
+            layer.update(FRAME_DT)
+        level = stages[index]
+
+        # drag the first movable mirror one cell over and back, as on_mouse_drag would
+        for m in layer.mirror_list:
+            if isinstance(m, MovableMirror):
+                cells = layer.board.empty_cells_near(m.index, 1)
+                if cells:
+                    origin = m.index
+                    layer.cell_grid(origin).move_item(layer.cell_grid(cells[0]))
+                    layer.update(FRAME_DT)
+                    layer.cell_grid(cells[0]).move_item(layer.cell_grid(origin))
+                    layer.update(FRAME_DT)
+                break
+        if layer.trace_result is None:
+            problems.append("%s: never traced" % path_list[index])
+        if len(layer.grid_dict) != len(layer.board.cell_dict):
+            problems.append("%s: %d grids for %d items" % (path_list[index], len(layer.grid_dict),
+                                                           len(layer.board.cell_dict)))
+        if len(layer.end_node_list) != len(level.end_list) or len(layer.mirror_list) != len(level.mirror_list):
+            problems.append("%s: items missing after load" % path_list[index])
+        print("%-24s %3d segments, %d end nodes" % (path_list[index], len(layer.trace_result.segments),
+                                                    len(layer.end_node_list)))
+
+        if index + 1 == len(path_list):
+            return problems
+        layer.on_stage_clear()
+        index += 1
+        if layer.index != index:
+            problems.append("%s: clearing did not advance to %s" % (path_list[index - 1], path_list[index]))
+            return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load every stage headlessly and check it comes up.")
+    parser.add_argument("levels", nargs="*", help="level files, levels/*.lvl when left out")
+    parser.add_argument("--headless", action="store_true", help="use pyglet's headless backend")
+    args = parser.parse_args()
+
+    from Benchmark import init_headless
+
+    init_headless(args.headless)
+    problems = check_stages(args.levels or sorted(glob.glob('levels/*.lvl')))
+    for problem in problems:
+        print("FAIL", problem)
+    if problems:
+        sys.exit(1)
@@ -0,0 +1,337 @@
+import argparse
+import itertools
+import multiprocessing
+import sys
+import time
+
+from Board import *
+from Level import load_level
+
+
+class Solution:
+    __slots__ = ("rotations", "placements", "parked")
+
+    def __init__(self, rotations, placements, parked):
+        # rotations : ((index, rotation), ...) for every rotatable mirror
+        # placements : ((index, rotation, reflect_percent), ...) for movable mirrors the beams cross
+        # parked : movable mirrors left anywhere off the beams
+        self.rotations = rotations
+        self.placements = placements
+        self.parked = parked
+
+    def key(self):
+        return self.rotations, self.placements
+
+    def __repr__(self):
+        return "Solution(rotations=%r, placements=%r, parked=%r)" % (self.rotations, self.placements, self.parked)
+
+
+class SolveStats:
+    def __init__(self):
+        self.tasks = 0
+        self.nodes = 0
+        self.traces = 0
+        self.pruned = 0
+        self.duplicates = 0
+        self.elapsed = 0
+        # False when the node budget ran out before the search space was exhausted
+        self.complete = True
+
+    def merge(self, other):
+        self.nodes += other.nodes
+        self.traces += other.traces
+        self.pruned += other.pruned
+        self.duplicates += other.duplicates
+        self.complete = self.complete and other.complete
+
+    def __repr__(self):
+        return "SolveStats(tasks=%d, nodes=%d, traces=%d, pruned=%d, duplicates=%d, elapsed=%.3fs, complete=%r)" % (
+            self.tasks, self.nodes, self.traces, self.pruned, self.duplicates, self.elapsed, self.complete)
+
+
+class SolveResult:
+    def __init__(self, solutions, stats):
+        self.solutions = solutions
+        self.stats = stats
+
+    @property
+    def solvable(self):
+        return len(self.solutions) > 0
+
+    @property
+    def unique(self):
+        return len(self.solutions) == 1
+
+
+def lit_cells(board, result):
+    # empty cells crossed by a beam that still carries strength -> {(direction, color)}, and the cells such beams stop at
+    cells = {}
+    hits = set()
+    for from_index, to_index, color, strength in result.segments:
+        if strength <= EPSILON:
+            continue
+        hits.add(to_index)
+        dx = (to_index[0] > from_index[0]) - (to_index[0] < from_index[0])
+        dy = (to_index[1] > from_index[1]) - (to_index[1] < from_index[1])
+        beam = (STEP.index((dx, dy)), color)
+        index = (from_index[0] + dx, from_index[1] + dy)
+        while index != to_index and board.in_bounds(index):
+            cells.setdefault(index, set()).add(beam)
+            index = (index[0] + dx, index[1] + dy)
+    return cells, hits
+
+
+def reaching_states(board, end):
+    # every (cell, direction) a beam can leave an empty cell with and still arrive at the end node
+    states = set()
+    seen = set()
+    stack = [(end.index, d) for d in range(4) if end.direction == -1 or abs(d - end.direction) == 2]
+    while stack:
+        index, direction = stack.pop()
+        step = STEP[direction]
+        prev = (index[0] - step[0], index[1] - step[1])
+        while board.in_bounds(prev) and board.get(prev) is None:
+            states.add((prev, direction))
+            prev = (prev[0] - step[0], prev[1] - step[1])
+
+        if not board.in_bounds(prev):
+            continue
+        item = board.get(prev)
+        if isinstance(item, MirrorRecord):
+            # reflect() is its own inverse, so this is the direction that leaves the mirror as `direction`
+            for incoming, possible in ((item.reflect(direction), item.reflect_percent > 0),
+                                       (direction, item.reflect_percent < 100)):
+                if possible and (prev, incoming) not in seen:
+                    seen.add((prev, incoming))
+                    stack.append((prev, incoming))
+    return states
+
+
+def enough_strength(board):
+    # mirrors only split a beam, so no color can deliver more than its start nodes emit
+    supply = {}
+    for s in board.start_node_list:
+        supply[s.color] = supply.get(s.color, 0) + s.strength
+    demand = {}
+    for e in board.end_node_list:
+        demand[e.color] = demand.get(e.color, 0) + e.goal_strength
+    for color, goal in demand.items():
+        if supply.get(color, 0) + EPSILON < goal:
+            return False
+    return True
+
+
+class Search:
+    # a movable mirror off every beam changes nothing, so only cells the current beams cross are branched on,
+    # and a state where a placed mirror went dark is the same board as the one with that mirror parked
+    def __init__(self, board, pieces, limit=None, max_nodes=None):
+        self.board = board
+        self.pieces = pieces
+        self.limit = limit
+        self.max_nodes = max_nodes
+        self.node_count = 0
+        self.empty_count = board.empty_count()
+
+        self.visited = set()
+        self.solutions = []
+        # solutions handed back by earlier tasks of this worker
+        self.found = 0
+        self.stats = SolveStats()
+
+    def done(self):
+        if self.max_nodes is not None and self.node_count >= self.max_nodes:
+            self.stats.complete = False
+            return True
+        return self.limit is not None and self.found + len(self.solutions) >= self.limit
+
+    def run(self, rotations, placements=()):
+        for index, rotation in rotations:
+            self.board.set_rotation(index, rotation)
+
+        remaining = list(self.pieces)
+        for index, rotation, reflect in placements:
+            remaining.remove((rotation, reflect))
+            self.board.place(MirrorRecord(index, MOVABLE, rotation, reflect))
+
+        # the empty placement task only checks the root, its children are tasks of their own
+        self.expand(rotations, frozenset(placements), tuple(remaining), bool(placements))
+
+        for index, rotation, reflect in placements:
+            self.board.remove(index)
+        return self
+
+    def expand(self, rotations, placements, remaining, branch=True):
+        # the board hash doubles as the transposition key
+        if self.board.hash in self.visited:
+            self.stats.duplicates += 1
+            return
+        self.visited.add(self.board.hash)
+        self.stats.nodes += 1
+        self.node_count += 1
+
+        self.stats.traces += 1
+        result = trace(self.board)
+        lit, hits = lit_cells(self.board, result)
+        for placement in placements:
+            if placement[0] not in hits:
+                self.stats.pruned += 1
+                return
+
+        if is_cleared(self.board, result.strengths):
+            if self.empty_count - len(placements) - len(lit) >= len(remaining):
+                self.solutions.append(Solution(rotations, tuple(sorted(placements)), len(remaining)))
+                if self.done():
+                    return
+
+        if not branch:
+            return
+        if not remaining:
+            self.stats.pruned += 1
+            return
+
+        unmet = []
+        if len(remaining) == 1:
+            # the last mirror has to change what every unmet end node receives, directly or by cutting its beam
+            unmet = [(e.color, reaching_states(self.board, e)) for e in self.board.end_node_list
+                     if abs(result.strengths[e.index] - e.goal_strength) > EPSILON]
+
+        for index in sorted(lit):
+            for piece in sorted(set(remaining)):
+                if unmet and not self.useful(index, lit[index], piece, unmet):
+                    self.stats.pruned += 1
+                    continue
+                rest = list(remaining)
+                rest.remove(piece)
+
+                self.board.place(MirrorRecord(index, MOVABLE, piece[0], piece[1]))
+                self.expand(rotations, placements | {(index, piece[0], piece[1])}, tuple(rest))
+                self.board.remove(index)
+
+                if self.done():
+                    return
+
+
+    def useful(self, index, beams, piece, unmet):
+        for color, states in unmet:
+            for direction, beam_color in beams:
+                if beam_color != color:
+                    continue
+                if (index, direction) in states or (index, REFLECT[piece[0]][direction]) in states:
+                    break
+            else:
+                return False
+        return True
+
+
+def split(board):
+    # strips the movable mirrors off a copy of the board, they become the pieces the search places
+    work = Board(board.grid_count)
+    pieces = []
+    for index, record in sorted(board.cell_dict.items()):
+        if isinstance(record, MirrorRecord) and record.kind == MOVABLE:
+            pieces.append((record.rotation, record.reflect_percent))
+            continue
+        work.place(record.copy())
+    return work, tuple(sorted(pieces))
+
+
+def rotation_choices(board):
+    rotatable = [m.index for m in board.mirror_list if m.kind == ROTATABLE]
+    for rotation in itertools.product((-1, 1), repeat=len(rotatable)):
+        yield tuple(zip(rotatable, rotation))
+
+
+def tasks(board, pieces):
+    # one task per rotatable orientation and first placement, so the pool has work to spread
+    for rotations in rotation_choices(board):
+        for index, rotation in rotations:
+            board.set_rotation(index, rotation)
+        yield rotations, ()
+        if pieces:
+            for index in sorted(lit_cells(board, trace(board))[0]):
+                for piece in sorted(set(pieces)):
+                    yield rotations, ((index, piece[0], piece[1]),)
+
+
+_worker_search = None
+
+
+def _init_worker(board, pieces, limit, max_nodes):
+    # one search per worker, so states reached again from another task are not traced twice
+    global _worker_search
+    _worker_search = Search(board, pieces, limit, max_nodes)
+
+
+def _run_task(task):
+    search = _worker_search
+    search.solutions = []
+    search.stats = SolveStats()
+    if search.done():
+        return [], search.stats
+    search.run(*task)
+    search.found += len(search.solutions)
+    return search.solutions, search.stats
+
+
+def solve(board, limit=None, processes=None, max_nodes=None):
+    start_time = time.perf_counter()
+    work, pieces = split(board)
+    stats = SolveStats()
+    found = {}
+
+    if enough_strength(work):
+        task_list = list(tasks(work, pieces))
+        stats.tasks = len(task_list)
+
+        if processes == 1:
+            _init_worker(work, pieces, limit, max_nodes)
+            results = map(_run_task, task_list)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(processes, _init_worker, (work, pieces, limit, max_nodes))
+            results = pool.imap_unordered(_run_task, task_list)
+
+        try:
+            for solutions, task_stats in results:
+                stats.merge(task_stats)
+                for solution in solutions:
+                    found.setdefault(solution.key(), solution)
+                if limit is not None and len(found) >= limit:
+                    break
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+    else:
+        stats.pruned += 1
+
+    solutions = [found[key] for key in sorted(found)]
+    if limit is not None:
+        solutions = solutions[:limit]
+    stats.elapsed = time.perf_counter() - start_time
+    return SolveResult(solutions, stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve Reflect level files.")
+    parser.add_argument("level", nargs="+")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many solutions")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--max-nodes", type=int, default=None, help="node budget per worker")
+    parser.add_argument("--max-time", type=float, default=None,
+                        help="fail when a level takes longer than this many seconds to solve")
+    args = parser.parse_args()
+
+    slow = []
+    for path in args.level:
+        result = solve(load_level(path).build_board(), args.limit, args.processes, args.max_nodes)
+        print("%s : %d solution(s), %r" % (path, len(result.solutions), result.stats))
+        for solution in result.solutions:
+            print("  %r" % (solution,))
+        if args.max_time is not None and result.stats.elapsed > args.max_time:
+            slow.append(path)
+
+    for path in slow:
+        print("SLOW %s took longer than %.3fs" % (path, args.max_time))
+    if slow:
+        sys.exit(1)
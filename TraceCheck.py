@@ -0,0 +1,116 @@
+import argparse
+import random
+import sys
+from collections import deque
+
+from Board import *
+
+TOLERANCE = 1e-9
+# a beam weaker than this is no longer pushed around a loop by the reference
+CUTOFF = 1e-14
+
+
+def random_board(rng):
+    # small boards with every kind of item, partial and see-through mirrors included so many of them loop
+    board = Board((rng.randint(3, 14), rng.randint(3, 14)))
+    free = [(x, y) for x in range(board.grid_count[0]) for y in range(board.grid_count[1])]
+    rng.shuffle(free)
+    colors = (RED, YELLOW)
+    mirror_density = rng.choice((0.1, 0.3, 0.5, 0.7))
+    partial = rng.choice((0, 0.5, 1))
+    for _ in range(rng.randint(1, 3)):
+        board.place(StartRecord(free.pop(), rng.randrange(4), rng.choice(colors), rng.choice((50, 100))))
+    for _ in range(rng.randint(1, 3)):
+        board.place(EndRecord(free.pop(), rng.choice(colors), 0, rng.randrange(-1, 4)))
+    for _ in range(rng.randint(0, len(free) // 10)):
+        board.place(ObstacleRecord(free.pop()))
+    for _ in range(int(len(free) * mirror_density)):
+        reflect = rng.choice((0, 50, 70, 90)) if rng.random() < partial else 100
+        board.place(MirrorRecord(free.pop(), rng.choice((MOVABLE, STATIC, ROTATABLE)), rng.choice((-1, 1)), reflect))
+    return board
+
+
+def reference_trace(board):
+    # independent of the flow graph and of next_item(): walks every run cell by cell and pushes strength
+    # around until what is left is below CUTOFF, so loops converge by brute force
+    # -> ({(from_index, to_index, color): strength}, {end index: strength})
+    segments = {}
+    strengths = {e.index: 0 for e in board.end_node_list}
+    seen = set()
+    pending = {}
+    queue = deque()
+
+    def push(state, amount):
+        if state in seen and amount <= CUTOFF:
+            return
+        seen.add(state)
+        if state not in pending:
+            pending[state] = 0
+            queue.append(state)
+        pending[state] += amount
+
+    for s in board.start_node_list:
+        push((s.index, s.direction, s.color), s.strength)
+
+    while queue:
+        state = queue.popleft()
+        amount = pending.pop(state)
+        origin_index, direction, color = state
+        step = STEP[direction]
+        index = (origin_index[0] + step[0], origin_index[1] + step[1])
+        while board.in_bounds(index) and board.get(index) is None:
+            index = (index[0] + step[0], index[1] + step[1])
+        key = (origin_index, index, color)
+        segments[key] = segments.get(key, 0) + amount
+
+        item = board.get(index) if board.in_bounds(index) else None
+        if isinstance(item, MirrorRecord):
+            percent = item.reflect_percent / 100
+            push((index, item.reflect(direction), color), amount * percent)
+            if item.reflect_percent < 100:
+                push((index, direction, color), amount * (1 - percent))
+        elif isinstance(item, EndRecord) and item.accepts(direction, color):
+            strengths[index] += amount
+    return segments, strengths
+
+
+def check_board(board):
+    # the differences between trace() and the reference, empty when they agree
+    result = trace(board)
+    segments, strengths = reference_trace(board)
+    traced = {}
+    for from_index, to_index, color, strength in result.segments:
+        traced[(from_index, to_index, color)] = traced.get((from_index, to_index, color), 0) + strength
+
+    problems = []
+    for key in traced.keys() | segments.keys():
+        if key not in traced or key not in segments:
+            problems.append("run %r only in %s" % (key, "trace()" if key in traced else "the reference"))
+        elif abs(traced[key] - segments[key]) > TOLERANCE:
+            problems.append("run %r carries %r, the reference %r" % (key, traced[key], segments[key]))
+    for index, strength in strengths.items():
+        if abs(result.strengths[index] - strength) > TOLERANCE:
+            problems.append("end node %r gets %r, the reference %r" % (index, result.strengths[index], strength))
+    return result, problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check trace() against a brute force tracer on random boards.")
+    parser.add_argument("--boards", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    looping = 0
+    failed = 0
+    for i in range(args.boards):
+        board = random_board(random.Random(args.seed + i))
+        result, problems = check_board(board)
+        if result.looped:
+            looping += 1
+        if problems:
+            failed += 1
+            print("FAIL seed %d, %dx%d board: %s" % (args.seed + i, board.grid_count[0], board.grid_count[1],
+                                                    problems[0]))
+    print("%d board(s), %d with loops, %d failed" % (args.boards, looping, failed))
+    if failed:
+        sys.exit(1)
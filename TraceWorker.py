@@ -0,0 +1,130 @@
+import threading
+import time
+
+from Board import trace
+
+# boards whose last trace took longer than this are traced off the main thread
+ASYNC_TRACE_TIME = 0.004
+# a newly loaded board with more items than this has its first trace, before any was timed, sent to the worker
+ASYNC_ITEM_COUNT = 400
+
+
+class TraceWorker:
+    # traces board snapshots on a background thread, only the latest request is kept,
+    # the game layer polls for the result every frame and swaps it in on the main thread
+    def __init__(self, idle_timeout=2.0):
+        self.idle_timeout = idle_timeout
+        self.condition = threading.Condition()
+        self.thread = None
+
+        self.pending = None
+        self.done = None
+        self.busy = False
+
+        # how long the most recent trace took, on either thread, and how long sends the next one off the main thread
+        self.trace_time = 0
+        self.async_time = ASYNC_TRACE_TIME
+        self.submitted = 0
+        self.dropped = 0
+
+    @property
+    def slow(self):
+        return self.trace_time > self.async_time
+
+    def expect(self, item_count):
+        # the last trace time belongs to the previous board, a new one starts from its size instead
+        self.trace_time = float("inf") if item_count > ASYNC_ITEM_COUNT else 0
+
+    def submit(self, board):
+        with self.condition:
+            if self.pending is not None:
+                # never started, the newer board replaces it
+                self.dropped += 1
+            self.pending = board
+            self.submitted += 1
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="TraceWorker", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def poll(self):
+        # (board snapshot, TraceResult) once a trace finished, else None
+        with self.condition:
+            done = self.done
+            self.done = None
+        return done
+
+    def idle(self):
+        with self.condition:
+            return self.pending is None and not self.busy and self.done is None
+
+    def run(self):
+        while True:
+            with self.condition:
+                if self.pending is None:
+                    self.condition.wait(self.idle_timeout)
+                if self.pending is None:
+                    # nothing asked for a while, a later submit starts a new thread
+                    self.thread = None
+                    return
+                board = self.pending
+                self.pending = None
+                self.busy = True
+
+            start_time = time.perf_counter()
+            result = trace(board)
+            elapsed = time.perf_counter() - start_time
+
+            with self.condition:
+                self.trace_time = elapsed
+                self.busy = False
+                if self.done is not None:
+                    self.dropped += 1
+                self.done = (board, result)
+
+
+class DropSpeculator:
+    # while a mirror is dragged, traces the board with it dropped on each candidate cell in turn,
+    # the game layer moves the results into its trace cache so hovering a cell is a cache hit
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.results = []
+        self.traced = 0
+
+    def start(self, board, from_index, cells):
+        self.cancel()
+        thread = threading.Thread(target=self.run, name="DropSpeculator", daemon=True,
+                                  args=(board.snapshot(), from_index, cells, self.generation))
+        thread.start()
+
+    def cancel(self):
+        with self.lock:
+            # a running thread notices the new generation and stops
+            self.generation += 1
+            self.results = []
+
+    def run(self, board, from_index, cells, generation):
+        index = from_index
+        for cell in cells:
+            if self.generation != generation:
+                return
+            board.move_item(index, cell)
+            index = cell
+            result = trace(board)
+
+            with self.lock:
+                if self.generation != generation:
+                    return
+                self.results.append((cell, (board.grid_count, board.hash), result))
+                self.traced += 1
+
+    def poll(self):
+        # [(cell, cache key, TraceResult)] finished since the last poll
+        with self.lock:
+            if not self.results:
+                # polled every frame, nothing is allocated while no drag is speculated
+                return ()
+            results = self.results
+            self.results = []
+        return results
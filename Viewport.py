@@ -0,0 +1,134 @@
+import math
+
+import cocos.batch
+import pyglet
+
+from Board import ObstacleRecord
+from GameObject import Box, Obstacle
+
+GRID_COLOR = (111, 189, 196)
+
+
+class Viewport:
+    # pans and zooms a stack of layers together, screen = offset + world * zoom
+    def __init__(self, layers, screen_size, world_size, max_zoom=2.0):
+        self.layers = layers
+        self.screen_size = screen_size
+        self.world_size = world_size
+        # zooming out stops once the whole board is on screen
+        self.min_zoom = min(1.0, screen_size[0] / world_size[0], screen_size[1] / world_size[1])
+        self.max_zoom = max_zoom
+
+        self.offset = (0, 0)
+        self.zoom = 1.0
+        # set whenever the view moved, the game layer clears it after culling
+        self.changed = True
+
+        for layer in self.layers:
+            layer.transform_anchor = (0, 0)
+        self.apply()
+
+    def apply(self):
+        self.offset = (self.clamp_axis(self.offset[0], 0), self.clamp_axis(self.offset[1], 1))
+        for layer in self.layers:
+            layer.position = self.offset
+            layer.scale = self.zoom
+        self.changed = True
+
+    def clamp_axis(self, offset, axis):
+        extent = self.world_size[axis] * self.zoom
+        if extent <= self.screen_size[axis]:
+            # smaller than the screen, keep it centered
+            return (self.screen_size[axis] - extent) / 2
+        return min(0, max(self.screen_size[axis] - extent, offset))
+
+    def to_world(self, position):
+        return (position[0] - self.offset[0]) / self.zoom, (position[1] - self.offset[1]) / self.zoom
+
+    def pan(self, dx, dy):
+        self.offset = (self.offset[0] + dx, self.offset[1] + dy)
+        self.apply()
+
+    def zoom_at(self, position, factor):
+        # the world point under the cursor stays under the cursor
+        zoom = min(self.max_zoom, max(self.min_zoom, self.zoom * factor))
+        world = self.to_world(position)
+        self.zoom = zoom
+        self.offset = (position[0] - world[0] * zoom, position[1] - world[1] * zoom)
+        self.apply()
+
+    def look_at(self, world):
+        self.offset = (self.screen_size[0] / 2 - world[0] * self.zoom, self.screen_size[1] / 2 - world[1] * self.zoom)
+        self.apply()
+
+    def visible_rect(self):
+        left, bottom = self.to_world((0, 0))
+        right, top = self.to_world(self.screen_size)
+        return left, bottom, right, top
+
+
+class ChunkGrid:
+    # grid boxes and obstacles only exist as sprites for the chunks on screen
+    def __init__(self, GameLayer, chunk_size=16):
+        self.GameLayer = GameLayer
+        self.chunk_size = chunk_size
+        # (cx, cy) -> (box batch, obstacle batch or None)
+        self.chunk_dict = {}
+        # sprites constructed over the grid's lifetime
+        self.created = 0
+        # pyglet only caches images weakly, with every box gone between stages the next stage would decode it again
+        self.box_image = pyglet.resource.image('img/grid.png')
+
+    def chunk_range(self, index_range):
+        x0, y0, x1, y1 = index_range
+        size = self.chunk_size
+        return range(x0 // size, math.ceil(x1 / size)), range(y0 // size, math.ceil(y1 / size))
+
+    def show(self, index_range):
+        x_range, y_range = self.chunk_range(index_range)
+        wanted = {(cx, cy) for cx in x_range for cy in y_range}
+
+        for key in list(self.chunk_dict):
+            if key not in wanted:
+                self.drop(key)
+        for key in sorted(wanted):
+            if key not in self.chunk_dict:
+                self.build(key)
+
+    def build(self, key):
+        layer = self.GameLayer
+        board = layer.board
+        box_batch = cocos.batch.BatchNode()
+        obs_batch = None
+
+        for x in range(key[0] * self.chunk_size, min(board.grid_count[0], (key[0] + 1) * self.chunk_size)):
+            for y in range(key[1] * self.chunk_size, min(board.grid_count[1], (key[1] + 1) * self.chunk_size)):
+                position = layer.mapper.position((x, y))
+                box_batch.add(Box(position, layer.grid_scale, (x, y), color=GRID_COLOR))
+                self.created += 1
+
+                if isinstance(board.get((x, y)), ObstacleRecord):
+                    if obs_batch is None:
+                        obs_batch = cocos.batch.BatchNode()
+                    obs_batch.add(Obstacle(position, layer.grid_scale, (x, y)))
+                    self.created += 1
+
+        # obstacles stay above the beams, boxes below them
+        layer.grid_layer.add(box_batch)
+        if obs_batch is not None:
+            layer.add(obs_batch)
+        self.chunk_dict[key] = (box_batch, obs_batch)
+
+    def drop(self, key):
+        box_batch, obs_batch = self.chunk_dict.pop(key)
+        self.GameLayer.grid_layer.remove(box_batch)
+        if obs_batch is not None:
+            self.GameLayer.remove(obs_batch)
+
+    def clear(self):
+        for key in list(self.chunk_dict):
+            self.drop(key)
+
+    def sprite_count(self):
+        return sum(len(box_batch.children) + (len(obs_batch.children) if obs_batch else 0)
+                   for box_batch, obs_batch in self.chunk_dict.values())
@@ -1,21 +1,56 @@
+import atexit
+import glob
+import os
+from collections import OrderedDict
+
 import cocos
 from cocos.euclid import *
 
 from cocos.menu import *
 from GameLayer import *
+from LeakCheck import AllocTracker
+from Level import load_level
+from Profiler import FrameProfiler, ProfilerHUD
 from cocos.director import director
 
 
 import pyglet.app
 
 class GameScene(cocos.scene.Scene):
-    def __init__(self, stages, index):
+    # one scene for the whole session, stages are loaded into its GameLayer in place
+    def __init__(self, stages, profiler=None):
         grid_layer = cocos.layer.Layer()
         line_layer = cocos.layer.Layer()
-        game_layer = GameLayer(grid_layer, line_layer, stages, index)
+        game_layer = GameLayer(grid_layer, line_layer, stages, 0)
         super(GameScene, self).__init__(cocos.layer.ColorLayer(255, 255, 255, 255), grid_layer, line_layer, game_layer)
         self.GameLayer = game_layer
 
+        # F3 toggles the profiling overlay
+        if profiler is not None:
+            game_layer.profiler = profiler
+            self.add(ProfilerHUD(game_layer, profiler), z=10)
+
+class StageLoader:
+    # parses a stage's level file on first use and keeps the recently played ones
+    def __init__(self, path_list, capacity=8):
+        self.path_list = path_list
+        self.capacity = capacity
+        self.level_dict = OrderedDict()
+
+    def __len__(self):
+        return len(self.path_list)
+
+    def __getitem__(self, index):
+        if index in self.level_dict:
+            self.level_dict.move_to_end(index)
+            return self.level_dict[index]
+
+        level = load_level(self.path_list[index])
+        self.level_dict[index] = level
+        while len(self.level_dict) > self.capacity:
+            self.level_dict.popitem(last=False)
+        return level
+
 class MainMenu(Menu):
     def __init__(self):
         super(MainMenu, self).__init__('Reflect')
@@ -33,16 +68,22 @@ class MainMenu(Menu):
         items = list()
         items.append(cocos.menu.MenuItem('Start from Begin', self.on_new_game))
         items.append(cocos.menu.MenuItem('Start with Selected Stage', self.on_selected_game))
-        items.append(cocos.menu.MultipleMenuItem('Stage Select : ', self.on_select, ['0', '1', '2', '3'], 0))
+        items.append(cocos.menu.MultipleMenuItem('Stage Select : ', self.on_select,
+                                                  [str(i) for i in range(len(stages))], 0))
         items.append(cocos.menu.MenuItem('Quit', pyglet.app.exit))
 
         self.create_menu(items, cocos.actions.ScaleTo(1.1, duration=0.25), cocos.actions.ScaleTo(1.0, duration=0.25))
 
     def on_new_game(self):
-        director.push(stages[0])
+        self.start(0)
 
     def on_selected_game(self):
-        director.push(stages[self.index])
+        self.start(self.index)
+
+    def start(self, index):
+        game_scene.GameLayer.menu_scene = self.get_ancestor(cocos.scene.Scene)
+        game_scene.GameLayer.load_stage(index)
+        director.replace(game_scene)
 
     def on_select(self, index):
         self.index = index
@@ -50,98 +91,15 @@ class MainMenu(Menu):
 if __name__ == "__main__":
     cocos.director.director.init(caption='Reflect', width=1000, height=1000)
 
-    stages = []
-
-    stage_0 = GameScene(stages, 0)
-
-    stage_0.GameLayer.grid_count = (3, 3)
-    stage_0.GameLayer.init_grid()
-
-    stage_0.GameLayer.spawn_start_node((0, 0), 0, RED, 100)
-    stage_0.GameLayer.spawn_obs((1, 1))
-    stage_0.GameLayer.spawn_end_node((2, 0), RED, 100)
-
-    stage_0.GameLayer.spawn_mirror(MovableMirror, (1, 2), 1, 100)
-    stage_0.GameLayer.spawn_mirror(RotatableMirror, (2, 2), 1, 100)
-
-    stages.append(stage_0)
-
-    # -------------------------------------------------------------------
-
-    stage_1 = GameScene(stages, 1)
-    stage_1.GameLayer.grid_count = (4, 4)
-    stage_1.GameLayer.init_grid()
-
-    stage_1.GameLayer.spawn_start_node((0, 0), 1, RED, 100)
-    stage_1.GameLayer.spawn_start_node((0, 3), 1, YELLOW, 100)
-    stage_1.GameLayer.spawn_obs((1, 2))
-    stage_1.GameLayer.spawn_obs((0, 2))
-    stage_1.GameLayer.spawn_obs((3, 2))
-    stage_1.GameLayer.spawn_end_node((3, 0), RED, 100, 0)
-    stage_1.GameLayer.spawn_end_node((2, 2), YELLOW, 100, 0)
-
-    stage_1.GameLayer.spawn_mirror(MovableMirror, (0, 1), -1, 100)
-    stage_1.GameLayer.spawn_mirror(MovableMirror, (2, 1), 1, 100)
-    stage_1.GameLayer.spawn_mirror(RotatableMirror, (2, 3), 1, 100)
-
-    stage_1.GameLayer.spawn_mirror(StaticMirror, (1, 0), 1, 100)
-
-    stages.append(stage_1)
-
-    # -------------------------------------------------------------------
-
-    stage_2 = GameScene(stages, 2)
-    stage_2.GameLayer.grid_count = (5, 5)
-    stage_2.GameLayer.init_grid()
-
-    stage_2.GameLayer.spawn_start_node((0, 0), 1, YELLOW, 100)
-    stage_2.GameLayer.spawn_start_node((1, 4), 1, RED, 100)
-
-    stage_2.GameLayer.spawn_end_node((2, 2), YELLOW, 100)
-    stage_2.GameLayer.spawn_end_node((0, 1), RED, 100)
-
-    stage_2.GameLayer.spawn_obs((1, 1))
-    stage_2.GameLayer.spawn_obs((2, 1))
-    stage_2.GameLayer.spawn_obs((3, 1))
-    stage_2.GameLayer.spawn_obs((1, 2))
-    stage_2.GameLayer.spawn_obs((3, 2))
-
-    stage_2.GameLayer.spawn_mirror(RotatableMirror, (4, 3), 1, 100)
-    stage_2.GameLayer.spawn_mirror(StaticMirror, (4, 0), 1, 100)
-
-    stage_2.GameLayer.spawn_mirror(MovableMirror, (0, 2), 1, 100)
-    stage_2.GameLayer.spawn_mirror(MovableMirror, (0, 3), -1, 100)
-    stage_2.GameLayer.spawn_mirror(MovableMirror, (0, 4), 1, 100)
-
-    stages.append(stage_2)
-
-    # -------------------------------------------------------------------
-
-    stage_3 = GameScene(stages, 3)
-    stage_3.GameLayer.grid_count = (6, 6)
-    stage_3.GameLayer.init_grid()
-
-    stage_3.GameLayer.spawn_start_node((0, 5), 1, RED, 100)
-    stage_3.GameLayer.spawn_start_node((5, 1), 3, RED, 100)
-    stage_3.GameLayer.spawn_end_node((4, 0), RED, 60)
-    stage_3.GameLayer.spawn_end_node((2, 2), RED, 50, 2)
-
-    stage_3.GameLayer.spawn_obs((1, 1))
-    stage_3.GameLayer.spawn_obs((1, 2))
-    stage_3.GameLayer.spawn_obs((1, 3))
-    stage_3.GameLayer.spawn_obs((2, 3))
-    stage_3.GameLayer.spawn_obs((3, 3))
-    stage_3.GameLayer.spawn_obs((4, 3))
-    stage_3.GameLayer.spawn_obs((5, 3))
-
-    stage_3.GameLayer.spawn_mirror(StaticMirror, (0, 0), -1, 100)
-    stage_3.GameLayer.spawn_mirror(MovableMirror, (0, 1), -1, 100)
-    stage_3.GameLayer.spawn_mirror(MovableMirror, (2, 5), 1, 100)
-    stage_3.GameLayer.spawn_mirror(MovableMirror, (3, 5), 1, 100)
-    stage_3.GameLayer.spawn_mirror(MovableMirror, (2, 4), -1, 90)
-    stage_3.GameLayer.spawn_mirror(MovableMirror, (3, 2), -1, 100)
-    stage_3.GameLayer.spawn_mirror(RotatableMirror, (4, 1), -1, 50)
+    # REFLECT_PROFILE_LOG=frames.csv streams per-frame timings to a rotating CSV log
+    profiler = FrameProfiler(os.environ.get('REFLECT_PROFILE_LOG'))
+    if profiler.log is not None:
+        atexit.register(profiler.log.close)
 
-    stages.append(stage_3)
+    stages = StageLoader(sorted(glob.glob('levels/*.lvl')))
+    game_scene = GameScene(stages, profiler)
+    # REFLECT_LEAK_CHECK=600 prints allocation and live node growth every 600 frames
+    if os.environ.get('REFLECT_LEAK_CHECK'):
+        AllocTracker().attach(game_scene.GameLayer, int(os.environ['REFLECT_LEAK_CHECK']))
 
     cocos.director.director.run(cocos.scene.Scene(cocos.layer.ColorLayer(111, 189, 196, 255), MainMenu()))